@@ -0,0 +1,15 @@
+"""
+This file exposes the Numba JIT decorator used by the route and traffic light optimizers
+"""
+import logging
+
+try:
+    from numba import njit
+except ImportError:
+    # Numba is optional - without it the compiled kernels run as plain Python
+    logging.warning("Numba not installed. Optimization kernels will run without JIT compilation.")
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
@@ -14,7 +14,7 @@ from extensions import db
 from forms import LoginForm, RegistrationForm
 from models import Courier, Route, Location, CourierRouteAssignment
 import config
-from route_optimizer import optimize_route, geocode_address, get_route_details, check_for_traffic_updates
+from route_optimizer import optimize_route, geocode_address, get_route_details, check_for_traffic_updates, to_json
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -234,7 +234,7 @@ def optimize():
         return redirect(url_for('index'))
     
     except Exception as e:
-        logging.error(f"Error in optimization: {str(e)}")
+        logging.exception(f"Error in optimization: {str(e)}")
         flash(f"An error occurred: {str(e)}", "danger")
         return redirect(url_for('index'))
 
@@ -279,7 +279,8 @@ def get_route():
                 route_data['last_traffic_update'] = current_time
                 session['optimized_route'] = route_data
     
-    return jsonify(route_data)
+    # Route data with full geometry can be large - serialize it with orjson
+    return app.response_class(to_json(route_data), mimetype='application/json')
 
 @app.route('/.well-known/<path:filename>')
 def well_known(filename):
@@ -1,55 +1,148 @@
 import requests
+from requests.adapters import HTTPAdapter
 import logging
-import json
+import orjson
 import math
 import time
 import random
-from itertools import permutations
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import chain
+import numpy as np
 import config
-from datetime import datetime, timedelta
-import pytz
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
 import math
 import time
 import random
 import traffic_light_optimizer
+from jit import njit
+
+# Shared HTTP session - keeps connections alive and pools them across API calls
+_http_session = requests.Session()
+_http_session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=16))
+_http_session.mount('http://', HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+# Random generator for traffic simulation - avoids reseeding the global generator
+_traffic_rng = np.random.default_rng()
+
+# Route colour and delay factor for each traffic level (0-3)
+_TRAFFIC_COLORS = ('green', 'yellow', 'orange', 'red')  # Free flowing, light, moderate, heavy traffic
+_DELAY_FACTORS = (0.0, 0.15, 0.3, 0.6)
+
+# Simulated traffic levels by (rounded segment, 5-minute time bucket), cleared when it grows past the limit
+_traffic_level_cache = {}
+_TRAFFIC_LEVEL_CACHE_SIZE = 4096
+
+# Segment fields which change with traffic - the rest of a segment is reused on a traffic refresh
+_REFRESHED_SEGMENT_FIELDS = ('distance', 'duration', 'base_duration', 'traffic_delay', 'traffic_level', 'traffic_color', 'avg_speed')
+
+# Grid (degrees, ~1 km) the traffic light regions are aligned to, so nearby routes reuse one region
+_TRAFFIC_LIGHT_REGION_GRID = 0.01
+
+# Light level (0 = pitch dark, 10 = full daylight) and status for every hour of the day
+_LIGHT_BY_HOUR = tuple(
+    (4, "dawn") if 6 <= hour < 8 else
+    (8, "morning") if 8 <= hour < 12 else
+    (9, "afternoon") if 12 <= hour < 17 else
+    (4, "dusk") if 17 <= hour < 19 else
+    (1, "night")
+    for hour in range(24)
+)
+
+# Approximate sun events for each season (Northern Hemisphere)
+_SPRING_SUN_EVENTS = {'dawn': "05:30", 'sunrise': "06:00", 'noon': "12:00", 'sunset': "19:00", 'dusk': "19:30"}
+_SUMMER_SUN_EVENTS = {'dawn': "04:30", 'sunrise': "05:00", 'noon': "12:00", 'sunset': "20:00", 'dusk': "20:30"}
+_FALL_SUN_EVENTS = {'dawn': "06:00", 'sunrise': "06:30", 'noon': "12:00", 'sunset': "18:00", 'dusk': "18:30"}
+_WINTER_SUN_EVENTS = {'dawn': "06:30", 'sunrise': "07:00", 'noon': "12:00", 'sunset': "17:00", 'dusk': "17:30"}
+
+# Sun events indexed by month (1-12)
+_SUN_EVENTS_BY_MONTH = (
+    None,
+    _WINTER_SUN_EVENTS, _WINTER_SUN_EVENTS,
+    _SPRING_SUN_EVENTS, _SPRING_SUN_EVENTS, _SPRING_SUN_EVENTS,
+    _SUMMER_SUN_EVENTS, _SUMMER_SUN_EVENTS, _SUMMER_SUN_EVENTS,
+    _FALL_SUN_EVENTS, _FALL_SUN_EVENTS, _FALL_SUN_EVENTS,
+    _WINTER_SUN_EVENTS
+)
+
+@dataclass(slots=True)
+class RouteSegment:
+    """Route segment between two consecutive points (a straight line with gray traffic if the route failed)"""
+    start_idx: int
+    end_idx: int
+    distance: float  # km
+    duration: float = 0  # seconds, with traffic delay
+    base_duration: float = 0
+    traffic_delay: float = 0
+    traffic_level: int = 0
+    traffic_color: str = 'gray'
+    geometry: list = field(default_factory=list)
+    encoded_geometry: str = None
+    weather: dict = None
+    instructions: list = field(default_factory=list)
+    road_features: list = field(default_factory=list)
+    avg_speed: float = 0  # km/h
+    # Dodajemy nowe informacje o oświetleniu i bezpieczeństwie
+    lighting_conditions: dict = None
+    accident_risk: dict = None
+    
+    def to_dict(self):
+        """Segment as a dictionary, in field order"""
+        return {name: getattr(self, name) for name in self.__slots__}
 
 def geocode_address(address):
     """Convert address to coordinates using OpenRouteService Geocoding API"""
     try:
-        # Check if API key is available
-        if not config.OPENROUTE_API_KEY:
-            logging.warning("OpenRouteService API key not configured. Geocoding will not work.")
-            return None
-            
-        params = {
-            'api_key': config.OPENROUTE_API_KEY,
-            'text': address
-        }
-        
-        response = requests.get(config.OPENROUTE_GEOCODE_URL, params=params)
-        
-        # Check for API key errors
-        if response.status_code == 401 or response.status_code == 403:
-            logging.error("Invalid OpenRouteService API key. Please check your API key configuration.")
-            return None
-            
-        response.raise_for_status()
-        
-        data = response.json()
-        if data['features'] and len(data['features']) > 0:
-            # Extract coordinates [longitude, latitude]
-            coords = data['features'][0]['geometry']['coordinates']
-            formatted_address = data['features'][0]['properties'].get('label', address)
-            return {
-                'coordinates': coords,
-                'formatted_address': formatted_address
-            }
-        else:
-            logging.error(f"No results found for address: {address}")
-            return None
+        # Addresses rarely change between requests, so results are cached on the normalized address
+        result = _geocode_address_cached(' '.join(address.split()).lower())
     except Exception as e:
+        # Failed requests raise, so they are not cached and are retried on the next call
         logging.error(f"Error geocoding address {address}: {str(e)}")
         return None
+    
+    if result is None:
+        return None
+    return {
+        'coordinates': list(result['coordinates']),
+        'formatted_address': result['formatted_address']
+    }
+
+@lru_cache(maxsize=4096)
+def _geocode_address_cached(address):
+    """Geocode a normalized address, caching the result"""
+    # Check if API key is available
+    if not config.OPENROUTE_API_KEY:
+        logging.warning("OpenRouteService API key not configured. Geocoding will not work.")
+        return None
+        
+    params = {
+        'api_key': config.OPENROUTE_API_KEY,
+        'text': address
+    }
+    
+    response = _http_session.get(config.OPENROUTE_GEOCODE_URL, params=params)
+    
+    # Check for API key errors
+    if response.status_code == 401 or response.status_code == 403:
+        logging.error("Invalid OpenRouteService API key. Please check your API key configuration.")
+        return None
+        
+    response.raise_for_status()
+    
+    data = orjson.loads(response.content)
+    if data['features'] and len(data['features']) > 0:
+        # Extract coordinates [longitude, latitude]
+        coords = data['features'][0]['geometry']['coordinates']
+        formatted_address = data['features'][0]['properties'].get('label', address)
+        return {
+            'coordinates': coords,
+            'formatted_address': formatted_address
+        }
+    else:
+        logging.error(f"No results found for address: {address}")
+        return None
 
 def get_distance_matrix(coordinates):
     """Get distance and duration matrix between all points using OpenRouteService API"""
@@ -71,7 +164,7 @@ def get_distance_matrix(coordinates):
             'units': 'km'
         }
         
-        response = requests.post(
+        response = _http_session.post(
             config.OPENROUTE_MATRIX_URL,
             headers=headers,
             json=body
@@ -80,211 +173,315 @@ def get_distance_matrix(coordinates):
         # Check for API key errors
         if response.status_code == 401 or response.status_code == 403:
             logging.error("Invalid OpenRouteService API key. Please check your API key configuration.")
-            return None
+            return estimate_distance_matrix(coordinates)
             
         response.raise_for_status()
         
-        data = response.json()
+        data = orjson.loads(response.content)
+        # Contiguous float32 matrices - half the memory of float64 and SIMD friendly
         return {
-            'durations': data['durations'],
-            'distances': data['distances']
+            'durations': np.ascontiguousarray(data['durations'], dtype=np.float32),
+            'distances': np.ascontiguousarray(data['distances'], dtype=np.float32)
         }
-    except Exception as e:
-        logging.error(f"Error getting distance matrix: {str(e)}")
-        return None
+    except (requests.RequestException, KeyError, ValueError, TypeError) as e:
+        logging.error(f"Error getting distance matrix, using straight-line estimate: {str(e)}")
+        return estimate_distance_matrix(coordinates)
+
+def estimate_distance_matrix(coordinates, average_speed_kmh=40):
+    """Estimate distance (km) and duration (s) matrix from straight-line distances"""
+    distances = calculate_distance_matrix(coordinates).astype(np.float32)
+    return {
+        'durations': distances / np.float32(average_speed_kmh / 3600),
+        'distances': distances
+    }
+
+@njit(cache=True)
+def _two_opt(durations, route, max_moves=1000):
+    """
+    Improve a route in place with 2-opt segment reversals until no reversal shortens it.
+    Durations may be asymmetric, so the reversed segment is costed in its new direction
+    """
+    for _ in range(max_moves):
+        improved = False
+        for i in range(1, len(route) - 1):
+            # Cost of the segment route[i:j] in its current and in reversed order
+            forward = 0.0
+            backward = 0.0
+            for j in range(i + 1, len(route)):
+                if j - 1 > i:
+                    forward += durations[route[j-2], route[j-1]]
+                    backward += durations[route[j-1], route[j-2]]
+                
+                # Calculate current segment cost
+                current_cost = durations[route[i-1], route[i]] + forward + durations[route[j-1], route[j]]
+                # Calculate cost after reversing route[i:j]
+                new_cost = durations[route[i-1], route[j-1]] + backward + durations[route[i], route[j]]
+                
+                # Require a real gain, so rounding can't make two reversals undo each other
+                if new_cost < current_cost - 1e-3:
+                    # Reverse the segment for improvement
+                    lo, hi = i, j - 1
+                    while lo < hi:
+                        route[lo], route[hi] = route[hi], route[lo]
+                        lo += 1
+                        hi -= 1
+                    improved = True
+                    break
+            if improved:
+                break
+        if not improved:
+            break
+    return route
+
+@njit(cache=True)
+def _nearest_neighbor_route(durations):
+    """Build a route from point 0 by always moving to the nearest unvisited point (up to 63 points)"""
+    n = durations.shape[0]
+    route = np.empty(n, dtype=np.int64)
+    route[0] = 0
+    current = 0
+    
+    # Unvisited points as a bitmask - every point except the start
+    unvisited = (1 << n) - 2
+    for k in range(1, n):
+        # Find nearest unvisited location
+        nearest = -1
+        nearest_cost = np.inf
+        for j in range(n):
+            if (unvisited >> j) & 1 and durations[current, j] < nearest_cost:
+                nearest = j
+                nearest_cost = durations[current, j]
+        route[k] = nearest
+        unvisited ^= 1 << nearest
+        current = nearest
+    return route
+
+def _route_cost(durations, route):
+    """Total duration of a route given as an array of point indices"""
+    return float(durations[route[:-1], route[1:]].sum())
+
+def _multi_start_two_opt(durations, num_starts):
+    """Run 2-opt from random initial routes (starting at point 0) and return the cheapest (route, cost)"""
+    best_route, best_cost = None, np.inf
+    for seed in range(num_starts):
+        rng = np.random.default_rng(seed)
+        route = np.concatenate(([0], rng.permutation(len(durations) - 1) + 1)).astype(np.int64)
+        route = _two_opt(durations, route)
+        cost = _route_cost(durations, route)
+        if cost < best_cost:
+            best_route, best_cost = route, cost
+    return best_route, best_cost
+
+@njit(cache=True)
+def _held_karp(durations):
+    """Find the shortest route starting at point 0 that visits every point (Held-Karp DP)"""
+    n = durations.shape[0]
+    full_mask = (1 << n) - 1
+    
+    # dp[mask, i] = minimal cost of reaching point i having visited the points in mask
+    dp = np.full((1 << n, n), np.inf)
+    parent = np.full((1 << n, n), -1, dtype=np.int64)
+    dp[1, 0] = 0.0
+    
+    for mask in range(1, full_mask + 1):
+        if not mask & 1:
+            continue
+        for i in range(n):
+            if not (mask >> i) & 1 or dp[mask, i] == np.inf:
+                continue
+            for j in range(n):
+                if (mask >> j) & 1:
+                    continue
+                next_mask = mask | (1 << j)
+                cost = dp[mask, i] + durations[i, j]
+                if cost < dp[next_mask, j]:
+                    dp[next_mask, j] = cost
+                    parent[next_mask, j] = i
+    
+    # Reconstruct the route by backtracking from the cheapest end point
+    route = np.empty(n, dtype=np.int64)
+    last = np.argmin(dp[full_mask])
+    mask = full_mask
+    for k in range(n - 1, -1, -1):
+        route[k] = last
+        previous = parent[mask, last]
+        mask ^= 1 << last
+        last = previous
+    return route
 
 def optimize_route(coordinates):
     """
     Enhanced route optimization with multiple algorithms
     Takes into account real-world parameters like traffic patterns
     """
-    try:
-        # Inicjalizacja zmiennych
-        route_duration = 0
-        best_route_indices = []
+    # Inicjalizacja zmiennych
+    route_duration = 0
+    best_route_indices = []
+    
+    if len(coordinates) <= 1:
+        return coordinates, 0, 0
         
-        if len(coordinates) <= 1:
-            return coordinates, 0, 0
-            
-        # Get distance/duration matrix from API
-        matrix = get_distance_matrix(coordinates)
+    # Get distance/duration matrix from API
+    matrix = get_distance_matrix(coordinates)
+    
+    if not matrix:
+        return None, 0, 0
         
-        if not matrix:
-            return None, 0, 0
+    durations = np.asarray(matrix['durations'], dtype=np.float32)
+    distances = np.asarray(matrix['distances'], dtype=np.float32)
+    
+    # Get current time to adjust for traffic patterns
+    current_hour = datetime.now().hour
+    
+    # Traffic multiplier based on time of day
+    # Higher during rush hours (7-9 AM, 4-6 PM)
+    is_rush = 7 <= current_hour <= 9 or 16 <= current_hour <= 18
+    if is_rush:
+        # More traffic in city centers during rush hour
+        # Simple simulation based on distance from center (>30km is outside urban center)
+        # Multiplier is 1.3 - 0.3 * min(1, distance / 30); the zero diagonal is unaffected
+        # Build the multiplier in a single buffer and apply it in one pass
+        factor = np.minimum(distances, 30.0)
+        factor *= -0.01
+        factor += 1.3
+        durations *= factor
+    
+    # For small number of points (<=12), use Held-Karp dynamic programming for optimal solution
+    if len(coordinates) <= 12:
+        logging.debug("Using Held-Karp optimization for small route")
+        # Exact solution starting with the first point, without return to start
+        best_route_indices = _held_karp(durations).tolist()
             
-        durations = matrix['durations']
-        distances = matrix['distances']
-        
-        # Get current time to adjust for traffic patterns
-        current_hour = datetime.now().hour
+    elif len(coordinates) <= 20:
+        logging.debug("Using enhanced nearest neighbor with 2-opt for medium route")
+        # For medium size, use nearest neighbor then improve with 2-opt
+        # Build initial solution with nearest neighbor
+        route_indices = _nearest_neighbor_route(durations)
+            
+        # Improve solution with 2-opt swaps
+        best_route = _two_opt(durations, route_indices)
+        best_cost = _route_cost(durations, best_route)
         
-        # Traffic multiplier based on time of day
-        # Higher during rush hours (7-9 AM, 4-6 PM)
-        traffic_multipliers = []
-        for i in range(len(coordinates)):
-            for j in range(len(coordinates)):
-                if i != j:
-                    # Rush hour traffic adjustment
-                    if 7 <= current_hour <= 9 or 16 <= current_hour <= 18:
-                        # More traffic in city centers during rush hour
-                        # Simple simulation based on distance from center
-                        city_center_factor = min(1.0, distances[i][j] / 30.0)  # Assume >30km is outside urban center
-                        traffic_multiplier = 1.0 + (0.3 * (1.0 - city_center_factor))
-                    else:
-                        traffic_multiplier = 1.0
-                        
-                    # Apply traffic multiplier to duration
-                    durations[i][j] *= traffic_multiplier
+        # 2-opt gets stuck in local minima, so also refine random initial routes
+        route, cost = _multi_start_two_opt(durations, 32)
+        if cost < best_cost:
+            best_route, best_cost = route, cost
         
-        # For small number of points (<=6), use brute force for optimal solution
-        if len(coordinates) <= 6:
-            logging.debug("Using brute force optimization for small route")
-            # Try all permutations starting with the first point
-            start = 0
-            min_duration = float('inf')
-            best_route_indices = None
-            
-            # Generate all possible routes starting from the first location
-            for perm in permutations(range(1, len(coordinates))):
-                route = [start] + list(perm)
-                
-                # Calculate total duration for this route
-                total_duration = 0
-                for i in range(len(route) - 1):
-                    from_idx = route[i]
-                    to_idx = route[i + 1]
-                    total_duration += durations[from_idx][to_idx]
-                
-                if total_duration < min_duration:
-                    min_duration = total_duration
-                    best_route_indices = route
+        route_indices = best_route.tolist()
                     
-            # Add return to start if needed (currently commented out)
-            # best_route_indices.append(start)
-                
-        elif len(coordinates) <= 12:
-            logging.debug("Using enhanced nearest neighbor with 2-opt for medium route")
-            # For medium size, use nearest neighbor then improve with 2-opt
-            start = 0
-            current = start
-            route_indices = [current]
-            unvisited = set(range(1, len(coordinates)))
-            
-            # Build initial solution with nearest neighbor
-            while unvisited:
-                # Find nearest unvisited location
-                nearest = min(unvisited, key=lambda x: durations[current][x])
-                route_indices.append(nearest)
-                unvisited.remove(nearest)
-                current = nearest
-                
-            # Improve solution with 2-opt swaps
-            improved = True
-            while improved:
-                improved = False
-                for i in range(1, len(route_indices) - 1):
-                    for j in range(i + 1, len(route_indices)):
-                        # Calculate current segment cost
-                        current_cost = durations[route_indices[i-1]][route_indices[i]] + durations[route_indices[j-1]][route_indices[j]]
-                        # Calculate cost after swap
-                        new_cost = durations[route_indices[i-1]][route_indices[j-1]] + durations[route_indices[i]][route_indices[j]]
-                        
-                        if new_cost < current_cost:
-                            # Reverse the segment for improvement
-                            route_indices[i:j] = reversed(route_indices[i:j])
-                            improved = True
-                            break
-                    if improved:
-                        break
-                        
-            best_route_indices = route_indices
+        best_route_indices = route_indices
+    
+    else:
+        logging.debug("Using hybrid algorithm for large route")
+        # For larger sets, use a hybrid approach
+        # First cluster points, then solve each cluster with nearest neighbor
         
-        else:
-            logging.debug("Using hybrid algorithm for large route")
-            # For larger sets, use a hybrid approach
-            # First cluster points, then solve each cluster with nearest neighbor
-            
-            # Start with first point
-            start = 0
-            best_route_indices = [start]
-            
-            # Process remaining points in batches
-            remaining = list(range(1, len(coordinates)))
-            
-            while remaining:
-                current = best_route_indices[-1]
-                
-                # Find the closest point from remaining points
-                closest = min(remaining, key=lambda x: durations[current][x])
-                best_route_indices.append(closest)
-                remaining.remove(closest)
-                
-                # Look ahead for possible improvements
-                if len(remaining) >= 2:
-                    # Try to find a point that would be a good next-next hop
-                    for point in remaining:
-                        # If this point is on the way to others, prioritize it
-                        connecting_score = 0
-                        for other in remaining:
-                            if other != point:
-                                # Check if point is "on the way" to other
-                                direct = durations[current][other]
-                                via_point = durations[current][point] + durations[point][other]
-                                
-                                # If going via this point doesn't add too much delay
-                                if via_point < direct * 1.2:  # within 20% of direct route
-                                    connecting_score += 1
-                        
-                        if connecting_score > 0:
-                            # This point connects well to others
-                            best_route_indices.append(point)
-                            remaining.remove(point)
-                            break
-            
-            # Calculate total duration
-            route_duration = 0
-            for i in range(len(best_route_indices) - 1):
-                from_idx = best_route_indices[i]
-                to_idx = best_route_indices[i + 1]
-                route_duration += durations[from_idx][to_idx]
+        # Start with first point
+        start = 0
+        best_route_indices = [start]
         
-        # Convert route indices to coordinates
-        optimized_route = [coordinates[i] for i in best_route_indices] if best_route_indices else []
+        # Process remaining points in batches
+        remaining = np.arange(1, len(coordinates))
         
-        # Calculate total distance
-        total_distance = 0
-        if best_route_indices and distances:
-            for i in range(len(best_route_indices) - 1):
-                from_idx = best_route_indices[i]
-                to_idx = best_route_indices[i + 1]
-                total_distance += distances[from_idx][to_idx]
+        while len(remaining):
+            current = best_route_indices[-1]
             
-        # Convert seconds to hours:minutes format
-        hours = int(route_duration / 3600) if best_route_indices else 0
-        minutes = int((route_duration % 3600) / 60) if best_route_indices else 0
-        time_str = f"{hours}h {minutes}m"
-        
-        # Round distance to 1 decimal place
-        distance_str = f"{total_distance:.1f}"
+            # Find the closest point from remaining points
+            closest_idx = np.argmin(durations[current, remaining])
+            best_route_indices.append(int(remaining[closest_idx]))
+            remaining = np.delete(remaining, closest_idx)
+            
+            # Look ahead for possible improvements
+            if len(remaining) >= 2:
+                # Try to find a point that would be a good next-next hop
+                # Point is "on the way" to other if going via it is within 20% of the direct route
+                direct = durations[current, remaining]
+                # Durations are non-negative, so a point whose direct duration is already 20% above
+                # the direct route to every other point can't be on the way - skip it before building
+                # via routes. The largest other direct duration is the maximum, or the second largest
+                # for the point holding the maximum
+                top_two = np.partition(direct, -2)[-2:]
+                others_max = np.full(len(direct), top_two[1])
+                others_max[np.argmax(direct)] = top_two[0]
+                candidates = np.flatnonzero(direct < others_max * 1.2)
+                via_point = direct[candidates, None] + durations[np.ix_(remaining[candidates], remaining)]
+                on_the_way = via_point < direct[None, :] * 1.2
+                on_the_way[np.arange(len(candidates)), candidates] = False
+                
+                connecting = candidates[on_the_way.any(axis=1)]
+                if len(connecting):
+                    # This point connects well to others
+                    best_route_indices.append(int(remaining[connecting[0]]))
+                    remaining = np.delete(remaining, connecting[0])
         
-        return optimized_route, time_str, distance_str
+        # Calculate total duration
+        route_duration = 0
+        for i in range(len(best_route_indices) - 1):
+            from_idx = best_route_indices[i]
+            to_idx = best_route_indices[i + 1]
+            route_duration += float(durations[from_idx][to_idx])
+    
+    # Convert route indices to coordinates
+    optimized_route = [coordinates[i] for i in best_route_indices] if best_route_indices else []
+    
+    # Calculate total distance
+    total_distance = 0
+    if best_route_indices and distances is not None:
+        for i in range(len(best_route_indices) - 1):
+            from_idx = best_route_indices[i]
+            to_idx = best_route_indices[i + 1]
+            total_distance += float(distances[from_idx][to_idx])
         
-    except Exception as e:
-        logging.error(f"Error optimizing route: {str(e)}")
-        return None, 0, 0
+    # Convert seconds to hours:minutes format
+    hours = int(route_duration / 3600) if best_route_indices else 0
+    minutes = int((route_duration % 3600) / 60) if best_route_indices else 0
+    time_str = f"{hours}h {minutes}m"
+    
+    # Round distance to 1 decimal place
+    distance_str = f"{total_distance:.1f}"
+    
+    return optimized_route, time_str, distance_str
+
+def _cache_time_bucket():
+    """Return the current 5-minute time bucket used to expire cached lookups"""
+    return int(time.monotonic() // 300)
 
 def get_weather(coords):
     """Get current weather conditions for a location using OpenWeatherMap API"""
+    # Convert coordinates from [longitude, latitude] to [latitude, longitude]
+    # Weather is regional, so nearby points (~10 km) share one cached API call
+    return _get_weather_cached(round(coords[1], 1), round(coords[0], 1), _cache_time_bucket())
+
+def get_weather_batch(points, executor=None):
+    """
+    Get weather for many [lon, lat] points - one lookup per ~10 km cell (see get_weather)
+    
+    Args:
+        points: Array-like of [lon, lat] points
+        executor: Optional executor to run the lookups of different cells concurrently
+    
+    Returns:
+        List with the weather of every point
+    """
+    # Cells rounded the same way as the get_weather cache key, so each cell is fetched once
+    cell_keys = [(round(lon, 1), round(lat, 1)) for lon, lat in np.asarray(points, dtype=np.float64).reshape(-1, 2).tolist()]
+    cells = list(dict.fromkeys(cell_keys))
+    if executor is None:
+        weather = [get_weather(cell) for cell in cells]
+    else:
+        weather = [future.result() for future in [executor.submit(get_weather, cell) for cell in cells]]
+    weather_by_cell = dict(zip(cells, weather))
+    return [weather_by_cell[key] for key in cell_keys]
+
+@lru_cache(maxsize=2048)
+def _get_weather_cached(lat, lon, time_bucket):
+    """Fetch weather for a rounded location, cached per time bucket"""
     try:
         # Check if API key is available
         if not config.WEATHER_API_KEY:
             logging.warning("Weather API key not configured. Weather data will not be available.")
             return None
             
-        # Convert coordinates from [longitude, latitude] to [latitude, longitude]
-        lat = coords[1]
-        lon = coords[0]
-        
         params = {
             'lat': lat,
             'lon': lon,
@@ -292,7 +489,7 @@ def get_weather(coords):
             'units': 'metric'  # Use metric units (Celsius, km/h)
         }
         
-        response = requests.get(config.WEATHER_API_URL, params=params)
+        response = _http_session.get(config.WEATHER_API_URL, params=params)
         
         # Check for API key errors
         if response.status_code == 401:
@@ -301,7 +498,7 @@ def get_weather(coords):
             
         response.raise_for_status()
         
-        data = response.json()
+        data = orjson.loads(response.content)
         
         # Extract relevant weather information
         weather_data = {
@@ -347,71 +544,22 @@ def get_daylight_conditions(lat, lon, time=None):
         0 = pitch dark, 5 = twilight, 10 = full daylight
     """
     if time is None:
-        time = datetime.now(pytz.UTC)
+        time = datetime.now(timezone.utc)
     else:
         # Ensure time is timezone aware
         if time.tzinfo is None:
-            time = time.replace(tzinfo=pytz.UTC)
+            time = time.replace(tzinfo=timezone.utc)
     
     try:
-        # Get the current hour (0-23) to simplify logic
-        current_hour = time.hour
-        
         # Simplified approach based on hour of day
-        if 6 <= current_hour < 8:  # Dawn
-            light_level = 4
-            status = "dawn"
-        elif 8 <= current_hour < 12:  # Morning
-            light_level = 8
-            status = "morning"
-        elif 12 <= current_hour < 17:  # Afternoon
-            light_level = 9
-            status = "afternoon"
-        elif 17 <= current_hour < 19:  # Dusk
-            light_level = 4
-            status = "dusk"
-        else:  # Night
-            light_level = 1
-            status = "night"
+        light_level, status = _LIGHT_BY_HOUR[time.hour]
         
-        # Generate approximate times for sun events based on the season
+        # Approximate times for sun events based on the season
         # This is a simple approximation and doesn't consider location accurately
-        month = time.month
-        
-        # Adjust sun events based on season (Northern Hemisphere)
-        if 3 <= month <= 5:  # Spring
-            dawn = "05:30"
-            sunrise = "06:00"
-            noon = "12:00"
-            sunset = "19:00"
-            dusk = "19:30"
-        elif 6 <= month <= 8:  # Summer
-            dawn = "04:30"
-            sunrise = "05:00"
-            noon = "12:00"
-            sunset = "20:00"
-            dusk = "20:30"
-        elif 9 <= month <= 11:  # Fall
-            dawn = "06:00"
-            sunrise = "06:30"
-            noon = "12:00"
-            sunset = "18:00"
-            dusk = "18:30"
-        else:  # Winter
-            dawn = "06:30"
-            sunrise = "07:00"
-            noon = "12:00"
-            sunset = "17:00"
-            dusk = "17:30"
-            
         return {
             'status': status,
-            'light_level': round(light_level, 1),
-            'dawn': dawn,
-            'sunrise': sunrise,
-            'noon': noon,
-            'sunset': sunset,
-            'dusk': dusk,
+            'light_level': light_level,
+            **_SUN_EVENTS_BY_MONTH[time.month],
             'current_time': time.strftime('%H:%M')
         }
     except Exception as e:
@@ -428,6 +576,19 @@ def get_daylight_conditions(lat, lon, time=None):
             'current_time': time.strftime('%H:%M')
         }
 
+def get_daylight_conditions_batch(points, time=None):
+    """
+    Calculates daylight conditions for many [lon, lat] points at once (see get_daylight_conditions)
+    
+    Returns:
+        List with the daylight dictionary of every point
+    """
+    if len(points) == 0:
+        return []
+    # The simplified model only depends on time, so every point shares one result
+    light_info = get_daylight_conditions(points[0][1], points[0][0], time)
+    return [light_info] * len(points)
+
 def get_accident_risk(lat, lon, time=None):
     """
     Estimates accident risk for a location based on time and lighting conditions
@@ -441,12 +602,33 @@ def get_accident_risk(lat, lon, time=None):
         Dictionary with risk factors and overall risk score (0-10)
     """
     if time is None:
-        time = datetime.now(pytz.UTC)
+        time = datetime.now(timezone.utc)
     else:
         # Ensure time is timezone aware
         if time.tzinfo is None:
-            time = time.replace(tzinfo=pytz.UTC)
+            time = time.replace(tzinfo=timezone.utc)
     
+    # Risk only depends on the hour, so cache by location and hour for the current time bucket
+    hour_start = time.replace(minute=0, second=0, microsecond=0)
+    return _get_accident_risk_cached(round(lat, 5), round(lon, 5), hour_start, _cache_time_bucket())
+
+def get_accident_risk_batch(points, time=None):
+    """
+    Estimates accident risk for many [lon, lat] points at once (see get_accident_risk)
+    
+    Returns:
+        List with the risk dictionary of every point
+    """
+    if len(points) == 0:
+        return []
+    # Points closer than the cache rounding share one estimate
+    unique_points, inverse = np.unique(np.round(np.asarray(points, dtype=np.float64), 5), axis=0, return_inverse=True)
+    risks = [get_accident_risk(lat, lon, time) for lon, lat in unique_points.tolist()]
+    return [risks[k] for k in inverse.ravel()]
+
+@lru_cache(maxsize=4096)
+def _get_accident_risk_cached(lat, lon, time, time_bucket):
+    """Estimate accident risk for a rounded location and hour, cached per time bucket"""
     # Get lighting conditions
     light_info = get_daylight_conditions(lat, lon, time)
     light_level = light_info['light_level']
@@ -456,8 +638,7 @@ def get_accident_risk(lat, lon, time=None):
         weather = get_weather([lon, lat])
         if weather and 'condition' in weather:
             weather_condition = weather['condition'].lower()
-            visibility_reduced = any(cond in weather_condition for cond in 
-                                ['rain', 'snow', 'fog', 'mist', 'drizzle', 'thunderstorm'])
+            visibility_reduced = _is_visibility_reduced(weather)
         else:
             weather_condition = "clear"
             visibility_reduced = False
@@ -510,9 +691,7 @@ def get_accident_risk(lat, lon, time=None):
     # In a real system, this would come from a database of accident hotspots
     
     # For this demo, we'll randomize but seed based on the coordinates for consistency
-    seed_value = int((lat * 1000 + lon * 1000) % 100000)
-    random.seed(seed_value)
-    risks['road_complexity_risk'] = random.uniform(0, 2)
+    risks['road_complexity_risk'] = _road_complexity_risk(lat, lon)
     
     # Calculate overall risk (0-10 scale)
     total_risk = (
@@ -532,12 +711,27 @@ def get_accident_risk(lat, lon, time=None):
         'light_conditions': light_info['status'],
         'light_level': light_info['light_level'],
         'visibility_reduced': visibility_reduced,
-        'recommendations': get_safety_recommendations(scaled_risk, risks, light_level < 5, visibility_reduced)
+        'recommendations': get_safety_recommendations(scaled_risk, risks, light_level < 5, visibility_reduced, time.hour)
     }
 
-def get_safety_recommendations(risk_score, risk_factors, is_dark, poor_visibility):
+@lru_cache(maxsize=4096)
+def _road_complexity_risk(lat, lon):
+    """Pseudo-random road complexity risk (0-2), seeded by the coordinates for consistency"""
+    seed_value = int((lat * 1000 + lon * 1000) % 100000)
+    return random.Random(seed_value).uniform(0, 2)
+
+def _is_visibility_reduced(weather):
+    """Check whether the weather conditions reduce visibility"""
+    if not weather or 'condition' not in weather:
+        return False
+    weather_condition = weather['condition'].lower()
+    return any(cond in weather_condition for cond in ['rain', 'snow', 'fog', 'mist', 'drizzle', 'thunderstorm'])
+
+def get_safety_recommendations(risk_score, risk_factors, is_dark, poor_visibility, hour=None):
     """Generate safety recommendations based on risk factors"""
     recommendations = []
+    if hour is None:
+        hour = datetime.now().hour
     
     if risk_score > 7:
         recommendations.append("Zachowaj szczególną ostrożność - wysoki poziom ryzyka na trasie.")
@@ -552,7 +746,7 @@ def get_safety_recommendations(risk_score, risk_factors, is_dark, poor_visibilit
         recommendations.append("Krytycznie niska widoczność - rozważ opóźnienie podróży jeśli to możliwe.")
     
     if risk_factors['time_of_day_risk'] > 1.5:
-        if datetime.now().hour < 12:
+        if hour < 12:
             recommendations.append("Poranny szczyt - spodziewaj się większego natężenia ruchu.")
         else:
             recommendations.append("Popołudniowy szczyt - spodziewaj się większego natężenia ruchu.")
@@ -578,20 +772,51 @@ def simulate_traffic_conditions(start, end):
         Integer traffic level (0-3)
         0 = Free flowing, 1 = Light traffic, 2 = Moderate traffic, 3 = Heavy traffic
     """
+    return int(simulate_traffic_conditions_batch([[start, end]])[0])
+
+def simulate_traffic_conditions_batch(segments, current_time=None, weather=None):
+    """
+    Simulates traffic conditions for many segments at once (see simulate_traffic_conditions)
+    
+    Args:
+        segments: Array-like of shape (N, 2, 2) - [[start_lon, start_lat], [end_lon, end_lat]] per segment
+        current_time: Optional timezone aware datetime (defaults to now)
+        weather: Optional already fetched weather at the midpoint of every segment (see get_weather_batch)
+    
+    Returns:
+        Integer array of traffic levels (0-3), one per segment
+    """
+    segments = np.asarray(segments, dtype=np.float64).reshape(-1, 2, 2)
+    
     # Get current time for simulation with timezone awareness
-    current_time = datetime.now(pytz.UTC)
+    if current_time is None:
+        current_time = datetime.now(timezone.utc)
+    
+    # Repeated queries for the same rounded segment within a 5-minute bucket (e.g. update polls)
+    # reuse the simulated level instead of drawing new random noise
+    time_bucket = int(current_time.timestamp() // 300)
+    keys = [tuple(segment) + (time_bucket,) for segment in np.round(segments.reshape(-1, 4), 5).tolist()]
+    levels = np.array([_traffic_level_cache.get(key, -1) for key in keys], dtype=np.int64)
+    missing = np.flatnonzero(levels < 0)
+    if len(missing):
+        levels[missing] = _simulate_traffic_levels(
+            segments[missing], current_time, None if weather is None else [weather[k] for k in missing]
+        )
+        if len(_traffic_level_cache) + len(missing) > _TRAFFIC_LEVEL_CACHE_SIZE:
+            _traffic_level_cache.clear()
+        _traffic_level_cache.update(zip([keys[k] for k in missing], levels[missing].tolist()))
+    return levels
+
+def _simulate_traffic_levels(segments, current_time, weather=None):
+    """Simulate the traffic levels of (N, 2, 2) segments - see simulate_traffic_conditions_batch"""
     current_hour = current_time.hour
     
-    # Calculate midpoint of the segment for analysis
-    mid_lat = (start[1] + end[1]) / 2
-    mid_lon = (start[0] + end[0]) / 2
+    # Calculate midpoints [lon, lat] of all segments for analysis
+    midpoints = segments.mean(axis=1)
     
     try:
-        # Get lighting conditions for this segment
-        light_info = get_daylight_conditions(mid_lat, mid_lon, current_time)
-        
-        # Get accident risk factors
-        risk_info = get_accident_risk(mid_lat, mid_lon, current_time)
+        # Lighting conditions only depend on time, so they are the same for every segment
+        light_info = get_daylight_conditions(midpoints[0, 1], midpoints[0, 0], current_time)
         
         # Base probability based on time of day
         if 7 <= current_hour <= 9:  # Morning rush hour
@@ -604,51 +829,42 @@ def simulate_traffic_conditions(start, end):
             base_probability = 0.2
         else:  # Late night/early morning
             base_probability = 0.1
+        probabilities = np.full(len(midpoints), base_probability)
         
         # Adjust for lighting conditions
         if light_info['light_level'] < 3:
             # Darkness tends to reduce overall traffic volume but may increase risk
-            base_probability -= 0.1  # Less traffic volume
+            probabilities -= 0.1  # Less traffic volume
         
-        # Adjust for weather/visibility from risk info
-        if risk_info.get('visibility_reduced', False):
-            base_probability += 0.15  # Worse traffic with poor visibility
+        # Adjust for weather/visibility - weather is regional, so it is fetched once per ~10 km grid cell
+        if weather is None:
+            weather = get_weather_batch(midpoints)
+        probabilities += 0.15 * np.array([_is_visibility_reduced(w) for w in weather])  # Worse traffic with poor visibility
         
         # Adjust for road complexity risk (higher risk often correlates with congestion)
-        road_complexity = risk_info.get('factors', {}).get('road_complexity_risk', 0)
-        if road_complexity > 1:
-            base_probability += 0.1  # Higher risk areas often have more traffic
+        road_complexity = np.array([_road_complexity_risk(lat, lon) for lon, lat in np.round(midpoints, 5).tolist()])
+        probabilities += 0.1 * (road_complexity > 1)  # Higher risk areas often have more traffic
         
         # Calculate day of week impact (weekends have less traffic)
         day_of_week = current_time.weekday()  # 0=Monday, 6=Sunday
         if day_of_week >= 5:  # Weekend
-            base_probability *= 0.7  # 30% reduction for weekends
-        
-        # Add some randomness (with different seed than risk calculation)
-        random.seed(int(time.time() * 1000) % 100000)  # Different seed
-        random_factor = random.random() * 0.3 - 0.15  # -0.15 to +0.15
+            probabilities *= 0.7  # 30% reduction for weekends
         
-        # Calculate final probability (cap between 0 and 1)
-        probability = max(0, min(1, base_probability + random_factor))
+        # Add some randomness (independent of the seeded risk calculation)
+        probabilities += _traffic_rng.random(len(midpoints)) * 0.3 - 0.15  # -0.15 to +0.15
         
-        # Determine traffic level based on probability
-        if probability < 0.2:
-            return 0  # Free flowing
-        elif probability < 0.5:
-            return 1  # Light traffic
-        elif probability < 0.8:
-            return 2  # Moderate traffic
-        else:
-            return 3  # Heavy traffic
+        # Determine traffic level based on probability (capped between 0 and 1)
+        # <0.2 free flowing, <0.5 light traffic, <0.8 moderate traffic, otherwise heavy traffic
+        return np.digitize(np.clip(probabilities, 0, 1), [0.2, 0.5, 0.8])
             
     except Exception as e:
         # If anything fails, return a reasonable default
         logging.error(f"Error in traffic simulation: {str(e)}")
         # Default based purely on time of day without other factors
         if 7 <= current_hour <= 9 or 16 <= current_hour <= 19:  # Rush hours
-            return 2  # Moderate traffic during rush hour
+            return np.full(len(segments), 2)  # Moderate traffic during rush hour
         else:
-            return 1  # Light traffic otherwise
+            return np.full(len(segments), 1)  # Light traffic otherwise
 
 def calculate_distance(point1, point2):
     """Calculate straight-line distance between two points in km"""
@@ -670,23 +886,254 @@ def calculate_distance(point1, point2):
     
     return distance
 
-def get_route_details(coordinates, include_traffic=True):
+def calculate_distance_matrix(points):
+    """Calculate straight-line distances in km between all pairs of [lon, lat] points"""
+    # Earth radius in km
+    R = 6371.0
+    
+    # Convert coordinates to radians
+    radians = np.radians(np.asarray(points, dtype=np.float64))
+    lon, lat = radians[:, 0], radians[:, 1]
+    
+    # Differences in coordinates for every pair of points
+    dlon = lon[None, :] - lon[:, None]
+    dlat = lat[None, :] - lat[:, None]
+    
+    # Haversine formula
+    a = np.sin(dlat / 2)**2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(np.maximum(0.0, 1 - a)))
+    return R * c
+
+def _haversine_batch(pairs):
+    """Calculate straight-line distances in km for an (N, 2, 2) array of [[lon, lat], [lon, lat]] pairs"""
+    # Earth radius in km
+    R = 6371.0
+    
+    # Convert coordinates to radians
+    radians = np.radians(np.asarray(pairs, dtype=np.float64)).reshape(-1, 2, 2)
+    lon1, lat1 = radians[:, 0, 0], radians[:, 0, 1]
+    lon2, lat2 = radians[:, 1, 0], radians[:, 1, 1]
+    
+    # Haversine formula
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(np.maximum(0.0, 1 - a)))
+    return R * c
+
+@lru_cache(maxsize=2048)
+def _decode_polyline_cached(encoded_geometry):
+    """Decode an encoded polyline (precision 5) into a read-only (N, 2) array of [lon, lat] points"""
+    chunks = np.frombuffer(encoded_geometry.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    if len(chunks) == 0:
+        return np.zeros((0, 2))
+    
+    # Every value is a run of 5-bit chunks, the last one without the continuation bit (0x20)
+    ends = np.flatnonzero((chunks & 0x20) == 0)
+    if len(ends) == 0 or ends[-1] != len(chunks) - 1 or len(ends) % 2:
+        raise ValueError("Truncated polyline")
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    
+    # Join the chunks of all values at once - least significant chunk first
+    shifts = 5 * (np.arange(len(chunks)) - np.repeat(starts, ends - starts + 1))
+    values = np.add.reduceat((chunks & 0x1f) << shifts, starts)
+    
+    # Values are zigzag encoded deltas of [lat, lon] pairs
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    points = np.ascontiguousarray((np.cumsum(deltas.reshape(-1, 2), axis=0) / 1e5)[:, ::-1])
+    points.flags.writeable = False
+    return points
+
+def decode_polyline(encoded_geometry):
+    """Decode an OpenRouteService encoded polyline into a list of [lon, lat] points"""
+    return _decode_polyline_cached(encoded_geometry).tolist()
+
+def _road_feature_type(instruction):
+    """Road feature mentioned in a route instruction (traffic lights win over roundabouts, roundabouts over turns)"""
+    instruction = instruction.lower()
+    if 'traffic light' in instruction or 'światłach' in instruction:
+        return 'traffic_light'
+    if 'roundabout' in instruction or 'rondo' in instruction:
+        return 'roundabout'
+    if 'turn' in instruction or 'skręć' in instruction:
+        return 'turn'
+    return None
+
+def _fallback_segment(i, start, end, distance=None):
+    """Straight line segment without duration, used when the route can't be calculated"""
+    return RouteSegment(
+        start_idx=i,
+        end_idx=i + 1,
+        distance=calculate_distance(start, end) if distance is None else distance,
+        geometry=[[start[0], start[1]], [end[0], end[1]]]
+    )
+
+def _fetch_route_segment(i, start, end, session, geometry_detail='full', include_encoded=True,
+                         fallback_distance=None):
+    """
+    Get route details for a single segment between two consecutive points
+    (traffic, weather, lighting and accident risk are left empty - filled in by get_route_details)
+    
+    geometry_detail and include_encoded work as in get_route_details, fallback_distance is
+    the precomputed straight-line distance used if the route can't be calculated
+    
+    Returns:
+        Tuple of the RouteSegment and its traffic condition entry
+        (None when the segment falls back to a straight line)
+    """
+    # Call OpenRouteService Directions API
+    headers = {
+        'Authorization': config.OPENROUTE_API_KEY,
+        'Content-Type': 'application/json; charset=utf-8'
+    }
+    
+    # Parametry dla wyświetlania geometrii trasy
+    # OpenRouteService wymaga współrzędnych w formacie [longitude, latitude]
+    body = {
+        "coordinates": [[start[0], start[1]], [end[0], end[1]]],
+        "instructions": True,
+        "preference": "recommended",
+        "geometry": True
+    }
+    
+    try:
+        response = session.post(
+            config.OPENROUTE_DIRECTIONS_URL,
+            json=body, 
+            headers=headers
+        )
+        
+        # Check for API key errors
+        if response.status_code == 401 or response.status_code == 403:
+            logging.error("Invalid OpenRouteService API key. Please check your API key configuration.")
+            raise Exception("Invalid API key")
+            
+        response.raise_for_status()
+        route_data = orjson.loads(response.content)
+        
+        # Extract route details
+        if 'routes' in route_data and len(route_data['routes']) > 0:
+            route = route_data['routes'][0]
+            geometry = route.get('geometry')
+            summary = route.get('summary', {})
+            
+            # Decode the geometry if it's in encoded format
+            geometry_coordinates = []
+            
+            # OpenRouteService zwraca geometrię jako zakodowany ciąg znaków polyline
+            # Zachowamy tę zakodowaną wersję, aby później zdekodować ją w JavaScript
+            encoded_geometry = None
+            
+            if isinstance(geometry, str):
+                # Zapisz oryginalny zakodowany string dla JavaScript
+                if include_encoded:
+                    encoded_geometry = geometry
+                # Dekodujemy geometrię także na serwerze, aby analiza świateł używała rzeczywistej trasy
+                try:
+                    geometry_coordinates = decode_polyline(geometry)
+                except (ValueError, IndexError) as e:
+                    # W razie błędu dekodowania stwórz prostą linię jako rezerwę
+                    logging.warning(f"Segment {i}: Nie udało się zdekodować geometrii: {str(e)}")
+                    geometry_coordinates = [[start[0], start[1]], [end[0], end[1]]]
+                logging.debug(f"Segment {i}: Zakodowana geometria polyline, długość: {len(geometry)}")
+            elif 'coordinates' in route.get('geometry', {}):
+                geometry_coordinates = route['geometry']['coordinates']
+                logging.debug(f"Segment {i}: Geometria jako współrzędne, punktów: {len(geometry_coordinates)}")
+            else:
+                geometry_coordinates = [[start[0], start[1]], [end[0], end[1]]]
+                logging.debug(f"Segment {i}: Brak geometrii, używamy linii prostej")
+            
+            # Log the geometry format for debugging
+            logging.debug(f"Segment {i}: Route geometry format: {type(geometry)}")
+            
+            # Keep only the first and last point when the caller doesn't draw the route
+            if geometry_detail == 'endpoints' and len(geometry_coordinates) > 2:
+                geometry_coordinates = [geometry_coordinates[0], geometry_coordinates[-1]]
+            
+            # Extract duration and distance
+            base_duration = summary.get('duration', 0)
+            distance = summary.get('distance', 0) / 1000  # Convert to km
+            
+            # Extract steps and instructions if available
+            instructions = [
+                {
+                    'instruction': step.get('instruction', ''),
+                    'distance': step.get('distance', 0),
+                    'duration': step.get('duration', 0)
+                }
+                for leg in route.get('legs', [])
+                for step in leg.get('steps', [])
+            ]
+            
+            # Dodajemy więcej informacji o trasie
+            road_features = []
+            
+            # Dodajemy informacje o światłach, skrzyżowaniach, etc.
+            for segment_info in route.get('segments', []):
+                for step in segment_info.get('steps', []):
+                    # Analizujemy instrukcje, aby wykryć światła, zakręty, etc.
+                    feature_type = _road_feature_type(step.get('instruction', ''))
+                    if feature_type:
+                        road_features.append({
+                            'type': feature_type,
+                            'distance': step.get('distance'),
+                            'description': step.get('instruction')
+                        })
+            
+            segment = RouteSegment(
+                start_idx=i,
+                end_idx=i + 1,
+                distance=distance,
+                duration=base_duration,
+                base_duration=base_duration,
+                geometry=geometry_coordinates,
+                encoded_geometry=encoded_geometry,  # Dodajemy zakodowaną wersję
+                instructions=instructions,
+                road_features=road_features,
+                avg_speed=round((distance * 1000 / base_duration) * 3.6, 1) if base_duration > 0 else 0  # km/h
+            )
+            
+            return segment, {'segment': i}
+        else:
+            logging.error("No routes found in the API response")
+            # Fall back to a simple straight line
+            return _fallback_segment(i, start, end, fallback_distance), None
+    except Exception as e:
+        logging.error(f"Error fetching route details: {str(e)}")
+        # Fall back to a simple straight line if route can't be calculated
+        return _fallback_segment(i, start, end, fallback_distance), None
+
+def _apply_traffic_level(segment, traffic_condition, traffic_level, include_traffic):
+    """Add the simulated traffic level (0-3) to a fetched segment and its traffic condition entry"""
+    # Calculate simulated delay based on traffic level
+    if include_traffic and traffic_level > 0:
+        segment.traffic_delay = segment.base_duration * _DELAY_FACTORS[traffic_level]
+    else:
+        segment.traffic_delay = 0
+    
+    # Store the adjusted duration and the color based on traffic level
+    segment.duration = segment.base_duration + segment.traffic_delay
+    segment.traffic_level = traffic_level
+    segment.traffic_color = _TRAFFIC_COLORS[traffic_level]
+    
+    traffic_condition.update(
+        level=traffic_level,
+        color=segment.traffic_color,
+        delay_seconds=segment.traffic_delay
+    )
+
+def get_route_details(coordinates, include_traffic=True, geometry_detail='full', include_encoded=True):
     """
     Get detailed route information between consecutive points
     
     Args:
         coordinates: List of longitude/latitude pairs
         include_traffic: Whether to include real-time traffic data (default: True)
+        geometry_detail: 'full' for the whole segment geometry, 'endpoints' for just
+            its first and last point (skips the traffic light analysis)
+        include_encoded: Whether to return the encoded polyline of each segment (default: True)
     
     Returns:
         Dictionary with route segments, total distance, and duration
     """
-    route_segments = []
-    total_distance = 0
-    total_duration = 0
-    traffic_conditions = []
-    traffic_delay_seconds = 0
-    
     # Check if API key is available
     if not config.OPENROUTE_API_KEY:
         logging.warning("OpenRouteService API key not configured. Detailed route information will not be available.")
@@ -700,261 +1147,95 @@ def get_route_details(coordinates, include_traffic=True):
             'error': "API key missing"
         }
     
+    # Read the clock once and share it between all segments
+    current_time = datetime.now(timezone.utc)
+    
+    # Dodajemy informacje o warunkach oświetleniowych i ryzyku wypadków - w środku każdego odcinka
+    coords_np = np.asarray(coordinates, dtype=np.float64)
+    mid_points = 0.5 * (coords_np[:-1] + coords_np[1:])
+    
+    # Straight-line distances of all segments in case their route can't be calculated
+    fallback_distances = _haversine_batch(np.stack([coords_np[:-1], coords_np[1:]], axis=1)).tolist()
+    
     # Calculate route between each consecutive point
-    for i in range(len(coordinates) - 1):
-        start = coordinates[i]
-        end = coordinates[i + 1]
+    # The directions and the weather (one request per ~10 km cell) are fetched concurrently -
+    # the traffic levels only adjust the fetched segments, so total wall time is about one round trip
+    num_segments = len(coordinates) - 1
+    with ThreadPoolExecutor(max_workers=max(1, min(16, 2 * num_segments))) as executor:
+        futures = [
+            executor.submit(
+                _fetch_route_segment, i, coordinates[i], coordinates[i + 1], _http_session,
+                geometry_detail, include_encoded, fallback_distances[i]
+            )
+            for i in range(num_segments)
+        ]
         
-        # Call OpenRouteService Directions API
-        headers = {
-            'Authorization': config.OPENROUTE_API_KEY,
-            'Content-Type': 'application/json; charset=utf-8'
-        }
+        # Weather at the segment midpoints and at each destination point (not for the return to start),
+        # fetched together so a cell shared by both is requested once
+        weather = get_weather_batch(np.concatenate((mid_points, coords_np[1:num_segments])), executor)
         
-        # Parametry dla wyświetlania geometrii trasy
-        # OpenRouteService wymaga współrzędnych w formacie [longitude, latitude]
-        body = {
-            "coordinates": [[start[0], start[1]], [end[0], end[1]]],
-            "instructions": True,
-            "preference": "recommended",
-            "geometry": True
-        }
+        # Simulate traffic conditions for all segments at once
+        traffic_levels = simulate_traffic_conditions_batch(
+            [[coordinates[i], coordinates[i + 1]] for i in range(num_segments)],
+            current_time, weather[:num_segments]
+        )
         
+        # Pobieramy informacje o warunkach oświetlenia na trasie
+        light_conditions = get_daylight_conditions_batch(mid_points, current_time)
         try:
-            response = requests.post(
-                config.OPENROUTE_DIRECTIONS_URL,
-                json=body, 
-                headers=headers
-            )
-            
-            # Check for API key errors
-            if response.status_code == 401 or response.status_code == 403:
-                logging.error("Invalid OpenRouteService API key. Please check your API key configuration.")
-                raise Exception("Invalid API key")
-                
-            response.raise_for_status()
-            route_data = response.json()
-            
-            # Extract route details
-            if 'routes' in route_data and len(route_data['routes']) > 0:
-                route = route_data['routes'][0]
-                geometry = route.get('geometry')
-                summary = route.get('summary', {})
-                
-                # Decode the geometry if it's in encoded format
-                geometry_coordinates = []
-                
-                # OpenRouteService zwraca geometrię jako zakodowany ciąg znaków polyline
-                # Zachowamy tę zakodowaną wersję, aby później zdekodować ją w JavaScript
-                encoded_geometry = None
-                
-                if isinstance(geometry, str):
-                    # Zapisz oryginalny zakodowany string dla JavaScript
-                    encoded_geometry = geometry
-                    # Dla kompatybilności stwórz też prostą linię jako rezerwę
-                    geometry_coordinates = [[start[0], start[1]], [end[0], end[1]]]
-                    logging.debug(f"Segment {i}: Zakodowana geometria polyline, długość: {len(geometry)}")
-                elif 'coordinates' in route.get('geometry', {}):
-                    geometry_coordinates = route['geometry']['coordinates']
-                    logging.debug(f"Segment {i}: Geometria jako współrzędne, punktów: {len(geometry_coordinates)}")
-                else:
-                    geometry_coordinates = [[start[0], start[1]], [end[0], end[1]]]
-                    logging.debug(f"Segment {i}: Brak geometrii, używamy linii prostej")
-                
-                # Log the geometry format for debugging
-                logging.debug(f"Segment {i}: Route geometry format: {type(geometry)}")
-                
-                # Extract duration and distance
-                base_duration = summary.get('duration', 0)
-                distance = summary.get('distance', 0) / 1000  # Convert to km
-                
-                # Simulate traffic conditions
-                traffic_level = simulate_traffic_conditions(start, end)
-                
-                # Calculate simulated delay based on traffic level
-                if include_traffic and traffic_level > 0:
-                    # Add delay based on traffic level (0-3)
-                    delay_factor = [0, 0.15, 0.3, 0.6][traffic_level]
-                    traffic_delay = base_duration * delay_factor
-                else:
-                    traffic_delay = 0
-                
-                # Store the adjusted duration
-                adjusted_duration = base_duration + traffic_delay
-                
-                # Set the color based on traffic level
-                if traffic_level == 0:
-                    traffic_color = 'green'  # Free flowing
-                elif traffic_level == 1:
-                    traffic_color = 'yellow'  # Light traffic
-                elif traffic_level == 2:
-                    traffic_color = 'orange'  # Moderate traffic
-                else:
-                    traffic_color = 'red'     # Heavy traffic
-                
-                # Get weather data for each destination point
-                weather_data = None
-                if i < len(coordinates) - 2:  # Don't get weather for the return to start
-                    weather_data = get_weather(end)
-                
-                # Extract steps and instructions if available
-                instructions = []
-                if 'legs' in route and len(route['legs']) > 0:
-                    for leg in route['legs']:
-                        for step in leg.get('steps', []):
-                            instructions.append({
-                                'instruction': step.get('instruction', ''),
-                                'distance': step.get('distance', 0),
-                                'duration': step.get('duration', 0)
-                            })
-                
-                # Dodajemy więcej informacji o trasie
-                road_features = []
-                
-                # Dodajemy informacje o światłach, skrzyżowaniach, etc.
-                if 'segments' in route and len(route['segments']) > 0:
-                    for segment_info in route['segments']:
-                        if 'steps' in segment_info:
-                            for step in segment_info['steps']:
-                                # Analizujemy instrukcje, aby wykryć światła, zakręty, etc.
-                                instruction = step.get('instruction', '').lower()
-                                if 'traffic light' in instruction or 'światłach' in instruction:
-                                    road_features.append({
-                                        'type': 'traffic_light', 
-                                        'distance': step.get('distance'),
-                                        'description': step.get('instruction')
-                                    })
-                                elif 'roundabout' in instruction or 'rondo' in instruction:
-                                    road_features.append({
-                                        'type': 'roundabout',
-                                        'distance': step.get('distance'),
-                                        'description': step.get('instruction')
-                                    })
-                                elif 'turn' in instruction or 'skręć' in instruction:
-                                    road_features.append({
-                                        'type': 'turn',
-                                        'distance': step.get('distance'),
-                                        'description': step.get('instruction')
-                                    })
-                
-                # Dodajemy informacje o warunkach oświetleniowych i ryzyku wypadków
-                mid_point_lat = (start[1] + end[1]) / 2
-                mid_point_lon = (start[0] + end[0]) / 2
-                
-                # Pobieramy informacje o warunkach oświetlenia na trasie
-                light_conditions = get_daylight_conditions(mid_point_lat, mid_point_lon)
-                
-                # Pobieramy analizę ryzyka wypadków
-                accident_risk = get_accident_risk(mid_point_lat, mid_point_lon)
-                
-                segment = {
-                    'start_idx': i,
-                    'end_idx': i + 1,
-                    'distance': distance,
-                    'duration': adjusted_duration,
-                    'base_duration': base_duration,
-                    'traffic_delay': traffic_delay,
-                    'traffic_level': traffic_level,
-                    'traffic_color': traffic_color,
-                    'geometry': geometry_coordinates,
-                    'encoded_geometry': encoded_geometry,  # Dodajemy zakodowaną wersję
-                    'weather': weather_data,
-                    'instructions': instructions,
-                    'road_features': road_features,
-                    'avg_speed': round((distance * 1000 / base_duration) * 3.6, 1) if base_duration > 0 else 0,  # km/h
-                    # Dodajemy nowe informacje o oświetleniu i bezpieczeństwie
-                    'lighting_conditions': light_conditions,
-                    'accident_risk': accident_risk
-                }
-                
-                total_distance += distance
-                total_duration += adjusted_duration
-                traffic_delay_seconds += traffic_delay
-                traffic_conditions.append({
-                    'segment': i,
-                    'level': traffic_level,
-                    'color': traffic_color,
-                    'delay_seconds': traffic_delay
-                })
-                route_segments.append(segment)
-            else:
-                logging.error("No routes found in the API response")
-                # Fall back to a simple straight line
-                segment = {
-                    'start_idx': i,
-                    'end_idx': i + 1,
-                    'distance': calculate_distance(start, end),
-                    'duration': 0,
-                    'base_duration': 0,
-                    'traffic_delay': 0,
-                    'traffic_level': 0,
-                    'traffic_color': 'gray',
-                    'geometry': [[start[0], start[1]], [end[0], end[1]]],
-                    'instructions': [],
-                    'weather': None
-                }
-                route_segments.append(segment)
+            weather_data = weather[num_segments:] + [None]
+            # Pobieramy analizę ryzyka wypadków dla wszystkich odcinków naraz - pogoda jest już w cache
+            accident_risks = get_accident_risk_batch(mid_points, current_time)
         except Exception as e:
-            logging.error(f"Error fetching route details: {str(e)}")
-            # Fall back to a simple straight line if route can't be calculated
-            segment = {
-                'start_idx': i,
-                'end_idx': i + 1,
-                'distance': calculate_distance(start, end),
-                'duration': 0,  # Cannot determine duration
-                'base_duration': 0,
-                'traffic_delay': 0,
-                'traffic_level': 0,
-                'traffic_color': 'gray',
-                'geometry': [[start[0], start[1]], [end[0], end[1]]],
-                'instructions': [],
-                'weather': None
-            }
-            route_segments.append(segment)
+            logging.error(f"Error fetching segment conditions: {str(e)}")
+            weather_data = accident_risks = None
+        results = [future.result() for future in futures]
     
-    # Format total_duration as a string (e.g., "2h 30m")
-    hours = int(total_duration / 3600)
-    minutes = int((total_duration % 3600) / 60)
-    formatted_duration = ''
-    if hours > 0:
-        formatted_duration += f"{hours}h "
-    formatted_duration += f"{minutes}m"
+    # Fallback segments keep their gray color and no traffic
+    for i, (segment, traffic_condition) in enumerate(results):
+        if traffic_condition:
+            _apply_traffic_level(segment, traffic_condition, int(traffic_levels[i]), include_traffic)
     
-    # For compatibility with older code
-    # min_duration variable is not used, removing to fix linting issues
+    # Fallback segments only carry the weather entry
+    if accident_risks is not None:
+        for i, (segment, traffic_condition) in enumerate(results):
+            if traffic_condition:
+                segment.weather = weather_data[i]
+                segment.lighting_conditions = light_conditions[i]
+                segment.accident_risk = accident_risks[i]
     
-    # Format traffic delay as a string
-    delay_minutes = int(traffic_delay_seconds / 60)
-    traffic_delay_text = f"+{delay_minutes}m due to traffic" if delay_minutes > 0 else "No delays"
+    # Segments leave the module as dictionaries (JSON for the frontend)
+    route_segments = [segment.to_dict() for segment, _ in results]
+    traffic_conditions = [traffic_condition for _, traffic_condition in results if traffic_condition]
     
     # Analiza świateł drogowych na trasie
     # Zbieramy geometrię z wszystkich segmentów do analizy
-    all_geometry = []
-    for segment in route_segments:
-        if 'geometry' in segment and segment['geometry']:
-            all_geometry.extend(segment['geometry'])
+    all_geometry = list(chain.from_iterable(segment.get('geometry') or () for segment in route_segments))
     
     # Jeśli mamy wystarczającą liczbę punktów geometrii, analizujemy światła
     traffic_light_analysis = None
-    if len(all_geometry) > 2:
+    if geometry_detail == 'full' and len(all_geometry) > 2:
         try:
-            # Inicjalizacja regionu dla symulowanych świateł
-            min_lon = min(point[0] for point in all_geometry)
-            max_lon = max(point[0] for point in all_geometry)
-            min_lat = min(point[1] for point in all_geometry)
-            max_lat = max(point[1] for point in all_geometry)
+            # Inicjalizacja regionu dla symulowanych świateł - jedno przejście NumPy po geometrii
+            geometry_np = np.asarray(all_geometry, dtype=np.float64)[:, :2]
+            min_lon, min_lat = geometry_np.min(axis=0).tolist()
+            max_lon, max_lat = geometry_np.max(axis=0).tolist()
             
-            # Dodaj bufor
+            # Dodaj bufor i wyrównaj region do siatki, aby trasy w tej samej okolicy dzieliły światła
             buffer = 0.01  # w przybliżeniu 1km
-            region_bounds = [
-                [min_lon - buffer, min_lat - buffer],
-                [max_lon + buffer, max_lat + buffer]
-            ]
+            grid = _TRAFFIC_LIGHT_REGION_GRID
+            region_key = (
+                round(math.floor((min_lon - buffer) / grid) * grid, 2),
+                round(math.floor((min_lat - buffer) / grid) * grid, 2),
+                round(math.ceil((max_lon + buffer) / grid) * grid, 2),
+                round(math.ceil((max_lat + buffer) / grid) * grid, 2)
+            )
             
-            # Inicjalizuj symulowane światła drogowe dla tego regionu
-            traffic_light_optimizer.initialize_traffic_light_map(region_bounds)
+            # Inicjalizuj symulowane światła drogowe dla tego regionu (generowane raz na region)
+            traffic_light_optimizer.initialize_traffic_light_map([region_key[:2], region_key[2:]])
             
-            # Analizuj trasę pod kątem świateł
+            # Analizuj trasę pod kątem świateł - na mapie całego regionu, której indeks przestrzenny
+            # i wyniki wyszukiwania są zapamiętywane (podzbiór świateł byłby za każdym razem nową tablicą)
             traffic_light_analysis = traffic_light_optimizer.analyze_route_for_lights({
                 'segments': route_segments,
                 'coordinates': all_geometry
@@ -966,18 +1247,179 @@ def get_route_details(coordinates, include_traffic=True):
     
     return {
         'segments': route_segments,
+        **_route_totals(route_segments, traffic_conditions),
+        'traffic_conditions': traffic_conditions,
+        'has_traffic_data': include_traffic,
+        'traffic_light_analysis': traffic_light_analysis,  # Dodajemy analizę świateł
+        'timestamp': int(time.time())
+    }
+
+def _route_totals(route_segments, traffic_conditions):
+    """
+    Calculate the totals of a route over the segments with route data (listed in traffic_conditions)
+    
+    Returns:
+        Dictionary with the distance, duration and traffic delay entries of the route details
+    """
+    # Numeric fields of the segments with route data as parallel arrays for the totals
+    numerics = np.array(
+        [(route_segments[condition['segment']]['distance'],
+          route_segments[condition['segment']]['duration'],
+          route_segments[condition['segment']]['traffic_delay'])
+         for condition in traffic_conditions],
+        dtype=[('distance', np.float64), ('duration', np.float64), ('traffic_delay', np.float64)]
+    )
+    total_distance = float(numerics['distance'].sum())
+    total_duration = float(numerics['duration'].sum())
+    traffic_delay_seconds = float(numerics['traffic_delay'].sum())
+    
+    # Format total_duration as a string (e.g., "2h 30m")
+    hours, remainder = divmod(int(total_duration), 3600)
+    minutes = remainder // 60
+    formatted_duration = f"{hours}h {minutes}m" if hours else f"{minutes}m"
+    
+    # Format traffic delay as a string
+    delay_minutes = int(traffic_delay_seconds / 60)
+    traffic_delay_text = f"+{delay_minutes}m due to traffic" if delay_minutes > 0 else "No delays"
+    
+    return {
         'total_distance': round(total_distance, 2),
         'total_duration': formatted_duration,
         'total_duration_seconds': total_duration,
         'base_duration_seconds': total_duration - traffic_delay_seconds,
         'traffic_delay_seconds': traffic_delay_seconds,
-        'traffic_delay_text': traffic_delay_text,
+        'traffic_delay_text': traffic_delay_text
+    }
+
+def _refresh_segments(route_details, updated_route, segment_indices):
+    """
+    Overlay the new durations and traffic of some segments on stored route details, reusing
+    their geometry, weather, instructions and traffic light analysis
+    
+    Args:
+        route_details: The stored route details (not modified)
+        updated_route: Route details with the current durations of the same segments
+        segment_indices: Indices of the segments to refresh
+    
+    Returns:
+        New route details dictionary
+    """
+    new_conditions = {condition['segment']: condition for condition in updated_route['traffic_conditions']}
+    conditions = {condition['segment']: condition for condition in route_details['traffic_conditions']}
+    
+    # Copy only the refreshed segments, the others are shared with the stored route
+    segments = list(route_details['segments'])
+    for i in segment_indices:
+        # Skip segments which fell back to a straight line in the new route
+        if i not in new_conditions:
+            continue
+        new_segment = updated_route['segments'][i]
+        segments[i] = {**segments[i], **{field: new_segment[field] for field in _REFRESHED_SEGMENT_FIELDS}}
+        conditions[i] = new_conditions[i]
+    
+    traffic_conditions = [conditions[i] for i in sorted(conditions)]
+    return {
+        **route_details,
+        'segments': segments,
+        **_route_totals(segments, traffic_conditions),
         'traffic_conditions': traffic_conditions,
-        'has_traffic_data': include_traffic,
-        'traffic_light_analysis': traffic_light_analysis,  # Dodajemy analizę świateł
         'timestamp': int(time.time())
     }
 
+def get_route_durations_only(coordinates, include_traffic=True):
+    """
+    Get the current duration of every segment between consecutive points with a single
+    matrix request - no geometry, weather or traffic lights
+    
+    Args:
+        coordinates: List of longitude/latitude pairs
+        include_traffic: Whether to add the simulated traffic delay (default: True)
+    
+    Returns:
+        Array of segment durations in seconds, or None if the durations are not available
+    """
+    if not config.OPENROUTE_API_KEY or len(coordinates) < 2:
+        return None
+    
+    headers = {
+        'Authorization': config.OPENROUTE_API_KEY,
+        'Content-Type': 'application/json; charset=utf-8',
+        'Accept': 'application/json, application/geo+json, application/gpx+xml'
+    }
+    
+    # Only the consecutive pairs are needed - the diagonal of the sources x destinations matrix
+    num_segments = len(coordinates) - 1
+    body = {
+        'locations': coordinates,
+        'sources': list(range(num_segments)),
+        'destinations': list(range(1, num_segments + 1)),
+        'metrics': ['duration']
+    }
+    
+    try:
+        response = _http_session.post(
+            config.OPENROUTE_MATRIX_URL,
+            headers=headers,
+            json=body
+        )
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        durations = np.diagonal(np.asarray(data['durations'], dtype=np.float64)).copy()
+    except (requests.RequestException, KeyError, ValueError, TypeError) as e:
+        logging.error(f"Error getting segment durations: {str(e)}")
+        return None
+    
+    if include_traffic:
+        # Same simulated delay as the segments of get_route_details
+        traffic_levels = simulate_traffic_conditions_batch(
+            [[coordinates[i], coordinates[i + 1]] for i in range(num_segments)]
+        )
+        durations *= 1 + np.array(_DELAY_FACTORS)[traffic_levels]
+    
+    return durations
+
+@njit(cache=True)
+def _max_change(old, new):
+    """
+    Percent change of every duration pair in one pass, with the position and value of the first
+    largest change (-1 and 0 if nothing changed). Pairs with a zero old duration count as no change
+    """
+    changes = np.zeros(old.size)
+    best = -1
+    best_change = 0.0
+    for i in range(old.size):
+        if old[i] == 0:
+            continue
+        changes[i] = abs(new[i] - old[i]) / old[i] * 100.0
+        if changes[i] > best_change:
+            best_change = changes[i]
+            best = i
+    return changes, best, best_change
+
+def _json_default(obj):
+    """Serialize datetimes as HTTP dates, the same way Flask's jsonify does"""
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            obj = obj.replace(tzinfo=timezone.utc)
+        return format_datetime(obj.astimezone(timezone.utc), usegmt=True)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def to_json(route_data):
+    """
+    Serialize route data to JSON bytes with orjson (NumPy arrays and scalars included)
+    
+    Args:
+        route_data: Route data, e.g. from get_route_details
+    
+    Returns:
+        UTF-8 encoded JSON with sorted keys, like Flask's jsonify
+    """
+    return orjson.dumps(
+        route_data,
+        default=_json_default,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS
+    )
+
 def check_for_traffic_updates(route_data, threshold_percent=15):
     """
     Check if traffic conditions have changed significantly since route was created
@@ -1024,37 +1466,42 @@ def check_for_traffic_updates(route_data, threshold_percent=15):
             'new_route': updated_route
         }
     
-    # Get current traffic conditions
-    updated_route = get_route_details(coordinates)
+    # Cheap probe first - one matrix request, and nothing more if no segment changed enough.
+    # Only durations without the simulated traffic delay are compared, so random noise in the
+    # simulation can't decide whether the route is refreshed
+    probe_durations = get_route_durations_only(coordinates, include_traffic=False)
+    if probe_durations is not None:
+        old_durations = np.array([segment.get('base_duration', 0) for segment in segments[:len(probe_durations)]], dtype=np.float64)
+        probe_durations = probe_durations[:len(old_durations)]
+        valid = old_durations != 0
+        probe_change = np.abs(probe_durations[valid] - old_durations[valid]) / old_durations[valid] * 100
+        if np.all(probe_change < threshold_percent):
+            return {
+                'needs_update': False,
+                'reason': "No significant traffic changes",
+                'max_change_percent': float(probe_change.max()) if len(probe_change) else 0,
+                'changed_segment': -1,
+                'duration_changes': [],
+                'new_route': None
+            }
     
-    # Compare segment durations
-    duration_changes = []
-    max_change_percent = 0
-    changed_segment_idx = -1
+    # Get current traffic conditions - only durations are compared, so skip the full geometry
+    updated_route = get_route_details(coordinates, geometry_detail='endpoints', include_encoded=False)
     
-    for i, (old_segment, new_segment) in enumerate(zip(segments, updated_route['segments'])):
-        if 'duration' not in old_segment or 'duration' not in new_segment:
-            continue
-            
-        old_duration = old_segment['duration']
-        new_duration = new_segment['duration']
-        
-        if old_duration == 0:
-            continue
-            
-        change_percent = abs(new_duration - old_duration) / old_duration * 100
-        
-        duration_changes.append({
-            'segment': i,
-            'old_duration': old_duration,
-            'new_duration': new_duration,
-            'change_percent': change_percent,
-            'increased': new_duration > old_duration
-        })
-        
-        if change_percent > max_change_percent:
-            max_change_percent = change_percent
-            changed_segment_idx = i
+    # Compare segment durations - collect comparable pairs as parallel arrays
+    compared = [
+        (i, old_segment['duration'], new_segment['duration'])
+        for i, (old_segment, new_segment) in enumerate(zip(segments, updated_route['segments']))
+        if 'duration' in old_segment and 'duration' in new_segment and old_segment['duration'] != 0
+    ]
+    segment_idx = np.array([i for i, _, _ in compared], dtype=np.int64)
+    old_durations = np.array([old for _, old, _ in compared], dtype=np.float64)
+    new_durations = np.array([new for _, _, new in compared], dtype=np.float64)
+    change_percent, max_pos, max_change = _max_change(old_durations, new_durations)
+    
+    # First segment with the largest change (none if nothing changed)
+    max_change_percent = float(max_change)
+    changed_segment_idx = int(segment_idx[max_pos]) if max_pos >= 0 else -1
     
     # Determine if an update is needed
     needs_update = max_change_percent >= threshold_percent
@@ -1067,8 +1514,9 @@ def check_for_traffic_updates(route_data, threshold_percent=15):
         from_location = f"point {changed_segment_idx + 1}"
         to_location = f"point {changed_segment_idx + 2}"
         
-        if changed_segment_idx < len(segments) - 1 and 'weather' in segments[changed_segment_idx + 1] and segments[changed_segment_idx + 1]['weather']:
-            to_location = segments[changed_segment_idx + 1]['weather']['location_name']
+        next_weather = segments[changed_segment_idx + 1].get('weather') if changed_segment_idx < len(segments) - 1 else None
+        if next_weather:
+            to_location = next_weather['location_name']
         
         # Create reason message
         old_minutes = int(old_segment['duration'] / 60)
@@ -1082,11 +1530,34 @@ def check_for_traffic_updates(route_data, threshold_percent=15):
     else:
         reason = "No significant traffic changes"
     
+    # Per-segment details are only reported with an update
+    duration_changes = []
+    new_route = None
+    if needs_update:
+        duration_changes = [
+            {
+                'segment': i,
+                'old_duration': old_duration,
+                'new_duration': new_duration,
+                'change_percent': float(change),
+                'increased': new_duration > old_duration
+            }
+            for (i, old_duration, new_duration), change in zip(compared, change_percent)
+        ]
+        
+        route_details = route_data['route_details']
+        if 'traffic_conditions' in route_details:
+            # Only durations changed - refresh them on the stored route instead of fetching it again
+            new_route = _refresh_segments(route_details, updated_route, segment_idx[change_percent > 0].tolist())
+        else:
+            # The new route replaces the displayed one, so it needs the full geometry
+            new_route = get_route_details(coordinates)
+    
     return {
         'needs_update': needs_update,
         'reason': reason,
         'max_change_percent': max_change_percent,
         'changed_segment': changed_segment_idx if needs_update else -1,
         'duration_changes': duration_changes,
-        'new_route': updated_route if needs_update else None
+        'new_route': new_route
     }
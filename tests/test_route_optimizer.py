@@ -0,0 +1,119 @@
+import itertools
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import route_optimizer
+
+
+def _asymmetric_matrix(n, seed):
+    """Random duration/distance matrix where A->B and B->A differ, like ORS durations"""
+    rng = np.random.default_rng(seed)
+    durations = rng.uniform(60, 1800, (n, n)).astype(np.float32)
+    np.fill_diagonal(durations, 0)
+    distances = durations / np.float32(60)
+    return {'durations': durations, 'distances': distances}
+
+
+class TwoOptAsymmetricTest(unittest.TestCase):
+    def test_two_opt_terminates_and_never_lengthens_route(self):
+        for seed in range(20):
+            matrix = _asymmetric_matrix(10, seed)
+            durations = matrix['durations']
+            initial = route_optimizer._nearest_neighbor_route(durations)
+            initial_cost = route_optimizer._route_cost(durations, initial)
+            
+            route = route_optimizer._two_opt(durations, initial.copy())
+            
+            self.assertEqual(sorted(route.tolist()), list(range(10)))
+            self.assertEqual(route[0], 0)
+            self.assertLessEqual(route_optimizer._route_cost(durations, route), initial_cost + 1e-3)
+
+    def test_optimize_route_with_asymmetric_matrix(self):
+        coordinates = [[16.9 + 0.01 * i, 52.4 + 0.005 * i] for i in range(15)]
+        matrix = _asymmetric_matrix(len(coordinates), seed=7)
+        with mock.patch.object(route_optimizer, 'get_distance_matrix', return_value=matrix):
+            optimized_route, time_str, distance_str = route_optimizer.optimize_route(coordinates)
+        
+        self.assertEqual(optimized_route[0], coordinates[0])
+        self.assertEqual(sorted(map(tuple, optimized_route)), sorted(map(tuple, coordinates)))
+        self.assertRegex(time_str, r'^\d+h \d+m$')
+
+
+class HeldKarpTest(unittest.TestCase):
+    def test_matches_brute_force_on_asymmetric_matrices(self):
+        for n in range(2, 8):
+            for seed in range(5):
+                durations = _asymmetric_matrix(n, seed)['durations']
+                best_cost = min(
+                    route_optimizer._route_cost(durations, np.array((0,) + order))
+                    for order in itertools.permutations(range(1, n))
+                )
+                
+                route = route_optimizer._held_karp(durations)
+                
+                self.assertEqual(route[0], 0)
+                self.assertEqual(sorted(route.tolist()), list(range(n)))
+                self.assertAlmostEqual(route_optimizer._route_cost(durations, route), best_cost, places=2)
+
+    def test_single_point(self):
+        self.assertEqual(route_optimizer._held_karp(np.zeros((1, 1), dtype=np.float32)).tolist(), [0])
+
+
+def _encode_value(delta):
+    """Reference zigzag + 5-bit chunk encoding of one polyline delta"""
+    value = ~(delta << 1) if delta < 0 else delta << 1
+    chunks = []
+    while value >= 0x20:
+        chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+        value >>= 5
+    chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def _encode_polyline(points):
+    """Reference polyline encoder (precision 5) for [lon, lat] points"""
+    encoded = []
+    previous = (0, 0)
+    for lon, lat in points:
+        current = (round(lat * 1e5), round(lon * 1e5))
+        encoded.extend(_encode_value(value - last) for value, last in zip(current, previous))
+        previous = current
+    return ''.join(encoded)
+
+
+class DecodePolylineTest(unittest.TestCase):
+    def test_known_polyline(self):
+        points = route_optimizer.decode_polyline('_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+        np.testing.assert_allclose(points, [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]])
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(3)
+        cases = [
+            # Negative deltas on both axes
+            [[16.95, 52.41], [16.94, 52.40], [16.93999, 52.39999], [-0.00001, -0.00001]],
+            # Values spanning many 5-bit chunks (large jumps and extreme coordinates)
+            [[179.99999, 89.99999], [-179.99999, -89.99999], [0.0, 0.0], [123.45678, -45.6789]],
+            np.round(rng.uniform([16.8, 52.3], [17.1, 52.5], (200, 2)), 5).tolist(),
+        ]
+        for points in cases:
+            decoded = route_optimizer._decode_polyline_cached(_encode_polyline(points))
+            self.assertEqual(decoded.shape, (len(points), 2))
+            np.testing.assert_allclose(decoded, points, atol=1e-9)
+            self.assertFalse(decoded.flags.writeable)
+
+    def test_empty_polyline(self):
+        self.assertEqual(route_optimizer.decode_polyline(''), [])
+
+    def test_truncated_polyline(self):
+        encoded = _encode_polyline([[16.95, 52.41], [-16.94, -52.40]])
+        # Cut inside a value, and after the latitude of the last point (no longitude)
+        lat_only = encoded[:len(_encode_polyline([[16.95, 52.41]])) + len(_encode_value(-5240000 - 5241000))]
+        for truncated in (encoded[:-1], encoded[:3], lat_only):
+            with self.assertRaises(ValueError):
+                route_optimizer._decode_polyline_cached(truncated)
+
+
+if __name__ == '__main__':
+    unittest.main()
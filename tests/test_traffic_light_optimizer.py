@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+import traffic_light_optimizer
+
+
+def _cycle_position(light_info, arrival_ts):
+    """Position in the light cycle (0 to cycle_time) at the given arrival time"""
+    return (np.asarray(arrival_ts) + light_info['offset']) % light_info['cycle_time']
+
+
+def _on_green(light_info, arrival_ts):
+    position = _cycle_position(light_info, arrival_ts)
+    # Arrivals right at the window start may round to just below a full cycle
+    return (position < light_info['green_time']) | (position > light_info['cycle_time'] - 1e-6)
+
+
+class GreenWindowSpeedTest(unittest.TestCase):
+    def test_arrives_on_green_closest_to_current_speed(self):
+        rng = np.random.default_rng(11)
+        checked = 0
+        for _ in range(500):
+            cycle_time = int(rng.integers(30, 150))
+            light_info = {
+                'cycle_time': cycle_time,
+                'offset': int(rng.integers(0, cycle_time)),
+                'green_time': int(rng.integers(5, cycle_time - 5)),
+            }
+            start_ts = 1_700_000_000 + int(rng.integers(0, 86400))
+            distance = float(rng.uniform(20, 1500))
+            min_speed = float(rng.uniform(2, 8))
+            max_speed = float(rng.uniform(min_speed, 20))
+            current_speed = float(rng.uniform(min_speed, max_speed))
+
+            speed = traffic_light_optimizer._green_window_speed(
+                light_info, start_ts, distance, current_speed, min_speed, max_speed
+            )
+
+            # Dense scan of the allowed speeds that arrive inside a green window
+            speeds = np.linspace(min_speed, max_speed, 20001)
+            positions = _cycle_position(light_info, start_ts + distance / speeds)
+            green_speeds = speeds[positions < light_info['green_time'] - 1e-3]
+            if speed is None:
+                self.assertEqual(len(green_speeds), 0)
+                continue
+
+            checked += 1
+            self.assertGreaterEqual(speed, min_speed - 1e-9)
+            self.assertLessEqual(speed, max_speed + 1e-9)
+            self.assertTrue(_on_green(light_info, start_ts + distance / speed))
+            if len(green_speeds):
+                self.assertLessEqual(abs(speed - current_speed), np.abs(green_speeds - current_speed).min() + 1e-9)
+        self.assertGreater(checked, 100)
+
+    def test_keeps_current_speed_on_green(self):
+        light_info = {'cycle_time': 90, 'offset': 0, 'green_time': 40}
+        # 200 m at 10 m/s arrives 20 s into the cycle
+        speed = traffic_light_optimizer._green_window_speed(light_info, 9000, 200, 10.0, 5.0, 15.0)
+        self.assertEqual(speed, 10.0)
+
+    def test_no_feasible_speed(self):
+        light_info = {'cycle_time': 90, 'offset': 0, 'green_time': 40}
+        # Arrivals between 50 and 60 s into the cycle all fall on red
+        self.assertIsNone(traffic_light_optimizer._green_window_speed(light_info, 9000, 600, 11.0, 10.0, 12.0))
+        self.assertIsNone(traffic_light_optimizer._green_window_speed(light_info, 9000, 0, 10.0, 5.0, 15.0))
+        self.assertIsNone(traffic_light_optimizer._green_window_speed(light_info, 9000, 200, 10.0, 15.0, 5.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,12 +7,14 @@ planowanie trasy poprzez uwzględnienie cyklów sygnalizacji świetlnej.
 """
 
 import math
-import random
 import logging
 import time
-from datetime import datetime, timedelta
-import pytz
+from datetime import datetime, timedelta, timezone
 from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+import numpy as np
+from jit import njit
 
 # Typowy czas cyklu sygnalizacji świetlnej (w sekundach) dla różnych typów skrzyżowań
 TRAFFIC_LIGHT_CYCLES = {
@@ -31,31 +33,165 @@ TRAFFIC_LIGHT_DELAYS = {
     'yellow': 5            # Małe opóźnienie na żółtym (należy zmniejszyć prędkość)
 }
 
+# Fazy sygnalizacji w kolejności cyklu (indeksy zwracane przez _light_status_codes)
+LIGHT_STATUSES = ('green', 'yellow', 'red')
+
+# Promień wyszukiwania świateł wokół punktów trasy (w metrach)
+LIGHT_DETECTION_RADIUS_METERS = 30
+
+# Metry na stopień szerokości geograficznej oraz długości geograficznej
+# (ta druga zależy od szerokości regionu - ustawiana w initialize_traffic_light_map)
+METERS_PER_DEG_LAT = 111320
+METERS_PER_DEG_LON = METERS_PER_DEG_LAT
+
+# Typy skrzyżowań w kolejności kodów type_code w LightTable
+LIGHT_TYPES = tuple(TRAFFIC_LIGHT_CYCLES)
+
+# Zakres czasu cyklu [min, max] dla kolejnych kodów typu
+_CYCLE_RANGES = np.array([[TRAFFIC_LIGHT_CYCLES[t]['min'], TRAFFIC_LIGHT_CYCLES[t]['max']] for t in LIGHT_TYPES])
+
+# Progi względnej odległości od centrum regionu i typy skrzyżowań w kolejnych przedziałach
+# (bliżej centrum większe skrzyżowania)
+_CENTER_DISTANCE_THRESHOLDS = np.array([0.2, 0.4, 0.7])
+_CENTER_DISTANCE_TYPES = np.array([
+    LIGHT_TYPES.index(t)
+    for t in ('complex_intersection', 'large_intersection', 'medium_intersection', 'small_intersection')
+], dtype=np.int8)
+
+def _delay_luts(cycle_time, green_time, yellow_time):
+    """
+    Buduje tablice opóźnień dla każdej sekundy cyklu wielu świateł naraz.
+    
+    Args:
+        cycle_time, green_time, yellow_time: Tablice czasów faz kolejnych świateł
+    
+    Returns:
+        Sklejone tablice opóźnień (int8) i początek tablicy każdego światła
+    """
+    cycle_time = np.asarray(cycle_time, dtype=np.int64)
+    lut_offset = np.cumsum(cycle_time) - cycle_time
+    
+    # Pozycja w cyklu i granice faz dla każdego elementu sklejonej tablicy
+    position = np.arange(cycle_time.sum()) - np.repeat(lut_offset, cycle_time)
+    green_end = np.repeat(green_time, cycle_time)
+    yellow_end = green_end + np.repeat(yellow_time, cycle_time)
+    
+    # Czerwone dzielone na początek (<25%), środek (<75%) i koniec cyklu czerwonego
+    with np.errstate(divide='ignore', invalid='ignore'):
+        red_fraction = (position - yellow_end) / (np.repeat(cycle_time, cycle_time) - yellow_end)
+    lut = np.select(
+        [position < green_end, position < yellow_end, red_fraction < 0.25, red_fraction < 0.75],
+        [TRAFFIC_LIGHT_DELAYS['green'], TRAFFIC_LIGHT_DELAYS['yellow'],
+         TRAFFIC_LIGHT_DELAYS['red_start'], TRAFFIC_LIGHT_DELAYS['red_middle']],
+        TRAFFIC_LIGHT_DELAYS['red_end']
+    ).astype(np.int8)
+    return lut, lut_offset
+
+@dataclass(slots=True, eq=False)
+class LightTable:
+    """
+    Światła drogowe w układzie kolumnowym - jedna tablica NumPy na każde pole,
+    wiersz i opisuje i-te światło. Tablice porównywane są po tożsamości (klucz cache).
+    
+    Tablice opóźnień wszystkich świateł są sklejone w delay_lut - światło i zajmuje
+    delay_lut[lut_offset[i]:lut_offset[i] + cycle_time[i]].
+    Indeksy przestrzenne (grids) są budowane przy pierwszym wyszukiwaniu i żyją tak długo jak tablica.
+    """
+    lon: np.ndarray
+    lat: np.ndarray
+    cycle_time: np.ndarray
+    offset: np.ndarray
+    green_time: np.ndarray
+    yellow_time: np.ndarray
+    type_code: np.ndarray
+    delay_lut: np.ndarray = None
+    lut_offset: np.ndarray = None
+    grids: dict = field(default_factory=dict)
+    
+    def __post_init__(self):
+        if self.delay_lut is None:
+            self.delay_lut, self.lut_offset = _delay_luts(self.cycle_time, self.green_time, self.yellow_time)
+    
+    @classmethod
+    def empty(cls, size=0):
+        """Tablica na size świateł wypełniona zerami"""
+        return cls(
+            np.zeros(size), np.zeros(size),
+            *(np.zeros(size, dtype=np.int16) for _ in range(4)),
+            np.zeros(size, dtype=np.int8)
+        )
+    
+    def __len__(self):
+        return len(self.lon)
+    
+    def take(self, indices):
+        """Podzbiór świateł wybrany indeksami lub maską"""
+        columns = {name: getattr(self, name)[indices] for name in self.__slots__ if name not in ('delay_lut', 'grids')}
+        
+        # Przepisz tablice opóźnień wybranych świateł jedna za drugą
+        cycle_time = columns['cycle_time'].astype(np.int64)
+        lut_offset = np.cumsum(cycle_time) - cycle_time
+        columns['delay_lut'] = self.delay_lut[
+            np.repeat(columns['lut_offset'] - lut_offset, cycle_time) + np.arange(cycle_time.sum())
+        ]
+        columns['lut_offset'] = lut_offset
+        return LightTable(**columns)
+    
+    def grid(self, cell_size, meters_per_deg_lon):
+        """Indeks przestrzenny świateł (patrz _light_grid) - budowany raz i przechowywany razem z tablicą"""
+        key = (cell_size, meters_per_deg_lon)
+        if key not in self.grids:
+            self.grids[key] = _light_grid(self, cell_size, meters_per_deg_lon)
+        return self.grids[key]
+    
+    def lonlat(self):
+        """Współrzędne świateł jako tablica (N, 2) [lon, lat]"""
+        return np.column_stack((self.lon, self.lat))
+    
+    def light_info(self, i):
+        """Informacje o i-tym świetle w postaci słownika"""
+        return {
+            'type': LIGHT_TYPES[self.type_code[i]],
+            'cycle_time': int(self.cycle_time[i]),
+            'offset': int(self.offset[i]),
+            'green_time': int(self.green_time[i]),
+            'yellow_time': int(self.yellow_time[i]),
+            'coordinates': [float(self.lon[i]), float(self.lat[i])]
+        }
+
 # Mapa skrzyżowań z sygnalizacją w regionie
 # W prawdziwym systemie te dane byłyby pobierane z API lub bazy danych
-# Format: [longitude, latitude]: {'type': typ_skrzyżowania, 'cycle_time': czas_cyklu, 'offset': przesunięcie_fazy}
-# Offset = 0 oznacza, że cykl zaczyna się od początku zdefiniowanego okresu (np. pełnej godziny)
-TRAFFIC_LIGHT_MAP = {}
+# Współrzędne zaokrąglone do 5 miejsc, offset = 0 oznacza, że cykl zaczyna się
+# od początku zdefiniowanego okresu (np. pełnej godziny)
+TRAFFIC_LIGHT_MAP = LightTable.empty()
 
 def initialize_traffic_light_map(region_bounds):
     """
     Inicjalizuje mapę świateł drogowych dla danego regionu.
     W prawdziwym systemie dane byłyby pobierane z API.
     
+    Światła dla danych granic są generowane raz i ponownie używane.
+    
     Args:
         region_bounds: [[min_lon, min_lat], [max_lon, max_lat]]
     """
-    global TRAFFIC_LIGHT_MAP
+    global TRAFFIC_LIGHT_MAP, METERS_PER_DEG_LON
     
-    # Resetuj mapę
-    TRAFFIC_LIGHT_MAP = {}
+    (min_lon, min_lat), (max_lon, max_lat) = region_bounds
+    TRAFFIC_LIGHT_MAP = _generate_light_table(min_lon, min_lat, max_lon, max_lat)
+    METERS_PER_DEG_LON = METERS_PER_DEG_LAT * math.cos(math.radians((min_lat + max_lat) / 2))
     
+    # Siatka do wyszukiwania świateł w domyślnym promieniu
+    if TRAFFIC_LIGHT_MAP:
+        TRAFFIC_LIGHT_MAP.grid(LIGHT_DETECTION_RADIUS_METERS, METERS_PER_DEG_LON)
+    return TRAFFIC_LIGHT_MAP
+
+@lru_cache(maxsize=32)
+def _generate_light_table(min_lon, min_lat, max_lon, max_lat):
+    """Generuje symulowane światła drogowe dla regionu (LightTable)"""
     # Używamy deterministycznego ziarna aby generować zawsze te same światła dla danego regionu
-    min_lon, min_lat = region_bounds[0]
-    max_lon, max_lat = region_bounds[1]
-    
     seed_val = int((min_lon + max_lon + min_lat + max_lat) * 1000) % 100000
-    random.seed(seed_val)
+    rng = np.random.default_rng(seed_val)
     
     # Symulacja gęstości świateł zależnie od położenia (wyższe wartości lat/lon = bliżej centrum miasta)
     center_lon = (min_lon + max_lon) / 2
@@ -66,127 +202,313 @@ def initialize_traffic_light_map(region_bounds):
     num_lights = int(area_size * 50000)  # Skalowanie liczby świateł
     num_lights = max(10, min(100, num_lights))  # Limit liczby świateł
     
-    # Generuj światła
-    for _ in range(num_lights):
-        # Bliżej centrum większa gęstość świateł
-        distance_factor = random.random()
-        lon = min_lon + (max_lon - min_lon) * (0.5 + (random.random() - 0.5) * distance_factor)
-        lat = min_lat + (max_lat - min_lat) * (0.5 + (random.random() - 0.5) * distance_factor)
-        
-        # Określ typ skrzyżowania (bliżej centrum większe skrzyżowania)
-        distance_to_center = math.sqrt((lon - center_lon)**2 + (lat - center_lat)**2)
-        max_distance = math.sqrt((max_lon - center_lon)**2 + (max_lat - center_lat)**2)
-        distance_ratio = distance_to_center / max_distance if max_distance > 0 else 0
-        
-        # Wybierz typ skrzyżowania
-        if distance_ratio < 0.2:
-            intersection_type = 'complex_intersection'
-        elif distance_ratio < 0.4:
-            intersection_type = 'large_intersection'
-        elif distance_ratio < 0.7:
-            intersection_type = 'medium_intersection'
-        else:
-            intersection_type = 'small_intersection'
-        
-        # Wygeneruj czas cyklu dla wybranego typu
-        cycle_min = TRAFFIC_LIGHT_CYCLES[intersection_type]['min']
-        cycle_max = TRAFFIC_LIGHT_CYCLES[intersection_type]['max']
-        cycle_time = random.randint(cycle_min, cycle_max)
+    # Generuj wszystkie światła naraz - bliżej centrum większa gęstość świateł
+    distance_factor, lon_factor, lat_factor = rng.random((3, num_lights))
+    lon = min_lon + (max_lon - min_lon) * (0.5 + (lon_factor - 0.5) * distance_factor)
+    lat = min_lat + (max_lat - min_lat) * (0.5 + (lat_factor - 0.5) * distance_factor)
+    
+    # Określ typ skrzyżowania na podstawie względnej odległości od centrum
+    max_distance = math.sqrt((max_lon - center_lon)**2 + (max_lat - center_lat)**2)
+    distance_ratio = np.hypot(lon - center_lon, lat - center_lat) / max_distance if max_distance > 0 else np.zeros(num_lights)
+    type_code = _CENTER_DISTANCE_TYPES[np.searchsorted(_CENTER_DISTANCE_THRESHOLDS, distance_ratio, side='right')]
+    
+    # Wygeneruj czas cyklu dla typu i przesunięcie fazy (offset)
+    cycle_min, cycle_max = _CYCLE_RANGES[type_code].T
+    cycle_time = rng.integers(cycle_min, cycle_max, endpoint=True)
+    offset = rng.integers(0, cycle_time)
+    
+    table = LightTable(
+        lon=np.round(lon, 5),
+        lat=np.round(lat, 5),
+        cycle_time=cycle_time.astype(np.int16),
+        offset=offset.astype(np.int16),
+        green_time=(cycle_time * 0.4).astype(np.int16),  # 40% cyklu to zielone
+        yellow_time=np.full(num_lights, 3, dtype=np.int16),  # Stały czas żółtego
+        type_code=type_code
+    )
+    
+    # Jedno skrzyżowanie na zaokrąglone położenie (pierwsze wygenerowane)
+    _, first = np.unique(np.column_stack((table.lon, table.lat)), axis=0, return_index=True)
+    table = table.take(np.sort(first))
+    logging.info(f"Zainicjalizowano {len(table)} świateł drogowych dla regionu")
+    return table
+
+def _light_grid(lights, cell_size, meters_per_deg_lon):
+    """
+    Buduje indeks przestrzenny świateł - regularną siatkę komórek o boku cell_size metrów.
+    
+    Światła są rozłożone w regionie równomiernie, więc przy boku równym promieniowi
+    wyszukiwania komórka zawiera najwyżej kilka świateł.
+    
+    Returns:
+        Położenia świateł w metrach, początek i bok siatki, liczba kolumn, posortowane klucze
+        zajętych komórek z początkami ich zakresów w light_order oraz indeksy świateł według komórek
+    """
+    light_xy = lights.lonlat() * (meters_per_deg_lon, METERS_PER_DEG_LAT)
+    origin = light_xy.min(axis=0)
+    cells = np.floor((light_xy - origin) / cell_size).astype(np.int64)
+    columns = int(cells[:, 0].max()) + 1
+    keys = cells[:, 1] * columns + cells[:, 0]
+    light_order = np.argsort(keys, kind='stable')
+    cell_keys, cell_start = np.unique(keys[light_order], return_index=True)
+    return light_xy, origin, cell_size, columns, cell_keys, np.append(cell_start, len(keys)), light_order
+
+def _to_meters(lonlat):
+    """Rzutuje punkty [lon, lat] na płaski układ w metrach dla bieżącego regionu"""
+    return np.asarray(lonlat, dtype=np.float64) * (METERS_PER_DEG_LON, METERS_PER_DEG_LAT)
+
+def _route_cumdist(points):
+    """
+    Odległość wzdłuż trasy (w metrach) dla każdego punktu - jedno przejście NumPy.
+    
+    Args:
+        points: Tablica (N, 2) punktów trasy [lon, lat]
+    
+    Returns:
+        Tablica float32 (N,) skumulowanych odległości, zaczynająca się od 0
+    """
+    steps = np.hypot(*np.diff(_to_meters(points), axis=0).T)
+    return np.concatenate(([0.0], np.cumsum(steps))).astype(np.float32)
+
+@njit(cache=True)
+def _scan_lights(points, light_xy, light_order, origin, cell_size, columns, cell_keys, cell_start, radius):
+    """
+    Sprawdza światła z komórki siatki każdego punktu trasy i komórek sąsiednich
+    (przy boku komórki nie mniejszym niż promień tylko tam mogą leżeć światła w zasięgu).
+    
+    Returns:
+        Dla każdego światła indeks pierwszego punktu trasy w promieniu (-1 gdy brak)
+    """
+    first_point = np.full(light_xy.shape[0], -1, dtype=np.int64)
+    start = np.zeros(9, dtype=np.int64)
+    end = np.zeros(9, dtype=np.int64)
+    last_x, last_y = 0, 0
+    for i in range(points.shape[0]):
+        cell_x = int(math.floor((points[i, 0] - origin[0]) / cell_size))
+        cell_y = int(math.floor((points[i, 1] - origin[1]) / cell_size))
         
-        # Wygeneruj przesunięcie fazy (offset)
-        offset = random.randint(0, cycle_time - 1)
+        # Kolejne punkty trasy zwykle leżą w tej samej komórce - zakresy świateł szukamy tylko po zmianie
+        if i == 0 or cell_x != last_x or cell_y != last_y:
+            last_x, last_y = cell_x, cell_y
+            c = 0
+            for y in range(cell_y - 1, cell_y + 2):
+                for x in range(cell_x - 1, cell_x + 2):
+                    start[c] = 0
+                    end[c] = 0
+                    if 0 <= x < columns and y >= 0:
+                        key = y * columns + x
+                        position = np.searchsorted(cell_keys, key)
+                        if position < cell_keys.shape[0] and cell_keys[position] == key:
+                            start[c] = cell_start[position]
+                            end[c] = cell_start[position + 1]
+                    c += 1
         
-        # Zapisz dane skrzyżowania
-        TRAFFIC_LIGHT_MAP[(round(lon, 5), round(lat, 5))] = {
-            'type': intersection_type,
-            'cycle_time': cycle_time,
-            'offset': offset,
-            'green_time': int(cycle_time * 0.4),  # 40% cyklu to zielone
-            'yellow_time': 3,  # Stały czas żółtego
-            'coordinates': [lon, lat]
-        }
-    
-    logging.info(f"Zainicjalizowano {len(TRAFFIC_LIGHT_MAP)} świateł drogowych dla regionu")
-    return TRAFFIC_LIGHT_MAP
+        for c in range(9):
+            for k in range(start[c], end[c]):
+                j = light_order[k]
+                if first_point[j] >= 0:
+                    continue
+                dx = points[i, 0] - light_xy[j, 0]
+                dy = points[i, 1] - light_xy[j, 1]
+                if math.sqrt(dx * dx + dy * dy) <= radius:
+                    first_point[j] = i
+    return first_point
 
-def detect_traffic_lights_on_route(route_geometry, radius_meters=30):
+def _route_light_indices(points, grid, radius):
     """
-    Wykrywa sygnalizacje świetlne na trasie.
+    Znajduje światła w promieniu od punktów trasy.
     
     Args:
-        route_geometry: Punkty geometrii trasy jako tablica [lon, lat]
-        radius_meters: Promień wyszukiwania świateł w metrach
+        points: Tablica (N, 2) punktów trasy w płaskim układzie (patrz _to_meters)
+        grid: Indeks świateł w tym samym układzie (patrz LightTable.grid), bok komórki nie mniejszy niż promień
+        radius: Promień wyszukiwania w jednostkach układu
     
     Returns:
-        Lista znalezionych świateł z ich pozycją na trasie i informacjami
+        Indeksy punktów trasy i świateł - dla każdego światła pierwszy punkt, który je widzi,
+        uporządkowane według punktów trasy, a dla punktu według kolejności świateł
     """
-    if not TRAFFIC_LIGHT_MAP:
+    light_xy, origin, cell_size, columns, cell_keys, cell_start, light_order = grid
+    
+    # Dla każdego światła pierwszy punkt trasy w promieniu (-1 gdy brak)
+    first_point = _scan_lights(points, light_xy, light_order, origin, cell_size, columns, cell_keys, cell_start, radius)
+    light_idx = np.flatnonzero(first_point >= 0)
+    point_idx = first_point[light_idx]
+    
+    # Kolejność jak przy przeglądaniu punktów trasy, a dla punktu - świateł w tablicy
+    order = np.lexsort((light_idx, point_idx))
+    return point_idx[order], light_idx[order]
+
+@lru_cache(maxsize=64)
+def _detect_cached(geometry_bytes, radius_meters, lights, meters_per_deg_lon):
+    """
+    Wyniki wyszukiwania świateł dla trasy zapamiętane według bajtów geometrii,
+    promienia, tablicy świateł i skali długości geograficznej.
+    
+    Returns:
+        Indeksy punktów trasy i świateł (tablice tylko do odczytu, patrz _route_light_indices)
+    """
+    points = np.frombuffer(geometry_bytes, dtype=np.float64).reshape(-1, 2)
+    grid = lights.grid(max(radius_meters, 1), meters_per_deg_lon)
+    point_idx, light_idx = _route_light_indices(points * (meters_per_deg_lon, METERS_PER_DEG_LAT), grid, radius_meters)
+    point_idx.flags.writeable = False
+    light_idx.flags.writeable = False
+    return point_idx, light_idx
+
+def _lights_for_route(route_geometry, candidate_lights=None):
+    """Tablica świateł do przeszukania dla trasy - w razie potrzeby inicjalizuje mapę regionu"""
+    if candidate_lights is None and not TRAFFIC_LIGHT_MAP:
         # Określ granice regionu na podstawie geometrii trasy
         lons = [p[0] for p in route_geometry]
         lats = [p[1] for p in route_geometry]
         min_lon, max_lon = min(lons), max(lons)
         min_lat, max_lat = min(lats), max(lats)
         
-        # Powiększ granice o bufor
+        # Powiększ granice o bufor i zaokrąglij, aby pobliskie trasy korzystały z tej samej mapy
         buffer = 0.01  # Około 1km bufor
         initialize_traffic_light_map([
-            [min_lon - buffer, min_lat - buffer],
-            [max_lon + buffer, max_lat + buffer]
+            [round(min_lon - buffer, 3), round(min_lat - buffer, 3)],
+            [round(max_lon + buffer, 3), round(max_lat + buffer, 3)]
         ])
     
-    # Konwersja promienia z metrów na stopnie (przybliżenie)
-    # 1 stopień ≈ 111 km na równiku, więc 1m ≈ 0.000009 stopnia
-    radius_deg = radius_meters * 0.000009
+    return TRAFFIC_LIGHT_MAP if candidate_lights is None else candidate_lights
+
+def _detect_light_indices(route_geometry, radius_meters=LIGHT_DETECTION_RADIUS_METERS, candidate_lights=None):
+    """
+    Wykrywa sygnalizacje świetlne na trasie bez budowania słowników.
+    
+    Args:
+        route_geometry: Punkty geometrii trasy [lon, lat] (lista lub tablica NumPy)
+        radius_meters: Promień wyszukiwania świateł w metrach
+        candidate_lights: Opcjonalny podzbiór TRAFFIC_LIGHT_MAP (LightTable) do sprawdzenia
+    
+    Returns:
+        LightTable, indeksy punktów trasy i indeksy świateł w tej tablicy - w kolejności wzdłuż trasy
+    """
+    lights = _lights_for_route(route_geometry, candidate_lights)
+    if not lights or len(route_geometry) == 0:
+        no_lights = np.zeros(0, dtype=np.int64)
+        return lights, no_lights, no_lights
+    
+    # Wyszukiwanie w metrach, aby promień był taki sam w obu osiach - powtórne zapytania
+    # o tę samą trasę (np. get_light_timing_for_route i analiza) korzystają z cache
+    points = np.ascontiguousarray(np.asarray(route_geometry, dtype=np.float64)[:, :2])
+    point_idx, light_idx = _detect_cached(points.tobytes(), radius_meters, lights, METERS_PER_DEG_LON)
+    return lights, point_idx, light_idx
+
+def detect_traffic_lights_on_route(route_geometry, radius_meters=LIGHT_DETECTION_RADIUS_METERS, candidate_lights=None,
+                                   route_cumdist=None):
+    """
+    Wykrywa sygnalizacje świetlne na trasie.
+    
+    Args:
+        route_geometry: Punkty geometrii trasy [lon, lat] (lista lub tablica NumPy)
+        radius_meters: Promień wyszukiwania świateł w metrach
+        candidate_lights: Opcjonalny podzbiór TRAFFIC_LIGHT_MAP (LightTable) do sprawdzenia (np. światła w obrębie trasy)
+        route_cumdist: Opcjonalna, wcześniej obliczona odległość wzdłuż trasy w metrach (patrz _route_cumdist)
+    
+    Returns:
+        Lista znalezionych świateł z ich pozycją na trasie (distance_along_route w metrach) i informacjami,
+        posortowana według odległości wzdłuż trasy
+    """
+    lights, point_idx, light_idx = _detect_light_indices(route_geometry, radius_meters, candidate_lights)
     
     # Znajdź wszystkie światła w pobliżu punktów trasy
     found_lights = []
-    
-    # Obliczamy odległość wzdłuż trasy dla każdego punktu
-    route_distance = 0.0
-    prev_point = None
-    route_distances = [0.0]  # Odległość dla pierwszego punktu (używamy float)
-    
-    for point in route_geometry[1:]:
-        if prev_point:
-            # Oblicz odległość między punktami (prosta formuła Pitagorasa, przybliżenie)
-            segment_dist = math.sqrt((point[0] - prev_point[0])**2 + (point[1] - prev_point[1])**2)
-            route_distance += segment_dist
-        route_distances.append(float(route_distance))  # Jawne konwertowanie do float
-        prev_point = point
-    
-    # Teraz dla każdego punktu trasy sprawdź pobliskie światła
-    checked_lights = set()  # Unikamy duplikatów
-    
-    for i, point in enumerate(route_geometry):
-        for light_coords, light_info in TRAFFIC_LIGHT_MAP.items():
-            light_lon, light_lat = light_coords
-            
-            # Szybkie sprawdzenie odległości (przybliżenie)
-            if (abs(point[0] - light_lon) <= radius_deg and 
-                abs(point[1] - light_lat) <= radius_deg and
-                light_coords not in checked_lights):
-                
-                # Dokładny pomiar odległości
-                distance = math.sqrt((point[0] - light_lon)**2 + (point[1] - light_lat)**2)
-                if distance <= radius_deg:
-                    found_lights.append({
-                        'coordinates': [light_lon, light_lat],
-                        'distance_along_route': route_distances[i],
-                        'route_point_index': i,
-                        'cycle_time': light_info['cycle_time'],
-                        'type': light_info['type'],
-                        'offset': light_info['offset'],
-                        'green_time': light_info['green_time'],
-                        'yellow_time': light_info['yellow_time']
-                    })
-                    checked_lights.add(light_coords)
-    
-    # Sortuj światła według odległości wzdłuż trasy
-    found_lights.sort(key=lambda x: x['distance_along_route'])
+    if len(light_idx) == 0:
+        return found_lights
+    
+    # Odległość wzdłuż trasy dla każdego punktu
+    if route_cumdist is None:
+        route_cumdist = _route_cumdist(np.asarray(route_geometry, dtype=np.float64)[:, :2])
+    route_distances = np.asarray(route_cumdist)[point_idx].tolist()
+    
+    # Dane świateł budujemy jako słowniki dopiero w wyniku - kolejność punktów trasy
+    # jest zarazem kolejnością odległości wzdłuż trasy
+    for k, (i, j) in enumerate(zip(point_idx.tolist(), light_idx.tolist())):
+        light_info = lights.light_info(j)
+        found_lights.append({
+            'coordinates': light_info['coordinates'],
+            'distance_along_route': route_distances[k],
+            'route_point_index': i,
+            'cycle_time': light_info['cycle_time'],
+            'type': light_info['type'],
+            'offset': light_info['offset'],
+            'green_time': light_info['green_time'],
+            'yellow_time': light_info['yellow_time']
+        })
     
     logging.debug(f"Wykryto {len(found_lights)} świateł drogowych na trasie")
     return found_lights
 
+@njit(cache=True)
+def _light_phases(arrival_ts, light_idx, cycle_time, offset, green_time, yellow_time, delay_lut, lut_offset):
+    """
+    Opóźnienie i kod fazy (indeks w LIGHT_STATUSES) przy przybyciu do kolejnych świateł
+    z LightTable - pozycja w cyklu i odczyt z tablicy opóźnień w jednej pętli.
+    
+    Args:
+        arrival_ts: Czasy przybycia (sekundy od epoki) do kolejnych świateł
+        light_idx: Indeksy tych świateł w LightTable
+        cycle_time, offset, green_time, yellow_time, delay_lut, lut_offset: Kolumny LightTable
+    
+    Returns:
+        Tablice opóźnień w sekundach i kodów fazy
+    """
+    delays = np.empty(light_idx.shape[0], dtype=np.int64)
+    codes = np.empty(light_idx.shape[0], dtype=np.int64)
+    for k in range(light_idx.shape[0]):
+        j = light_idx[k]
+        position = (np.int64(arrival_ts[k]) + offset[j]) % cycle_time[j]
+        delays[k] = delay_lut[lut_offset[j] + position]
+        codes[k] = int(position >= green_time[j]) + int(position >= green_time[j] + yellow_time[j])
+    return delays, codes
+
+def _build_delay_lut(light_info):
+    """
+    Tablica opóźnień dla każdej sekundy cyklu sygnalizacji.
+    
+    Tablice są brane z pamięci podręcznej według czasów faz - light_info nie jest modyfikowane.
+    
+    Args:
+        light_info: Informacje o sygnalizacji
+    
+    Returns:
+        Tablica int8 o długości cycle_time z opóźnieniem w sekundach dla pozycji w cyklu
+    """
+    return _phase_delay_lut(light_info['cycle_time'], light_info['green_time'], light_info['yellow_time'])
+
+@lru_cache(maxsize=1024)
+def _phase_delay_lut(cycle_time, green_time, yellow_time):
+    """Tablica opóźnień (tylko do odczytu) dla jednego zestawu czasów faz"""
+    lut, _ = _delay_luts([cycle_time], [green_time], [yellow_time])
+    lut.flags.writeable = False
+    return lut
+
+def _light_status_codes(light_info, cycle_position):
+    """Indeks w LIGHT_STATUSES dla pozycji w cyklu (liczba lub tablica)"""
+    green_time = light_info['green_time']
+    yellow_end = green_time + light_info['yellow_time']
+    return (cycle_position >= green_time) * 1 + (cycle_position >= yellow_end) * 1
+
+def _delay_from_ts(light_info, arrival_ts):
+    """
+    Opóźnienie i kod fazy (indeks w LIGHT_STATUSES) dla czasu przybycia w sekundach od epoki.
+    
+    Args:
+        light_info: Informacje o sygnalizacji
+        arrival_ts: Czas przybycia (liczba lub tablica NumPy)
+    
+    Returns:
+        Opóźnienia i kody fazy - liczby lub tablice, zależnie od arrival_ts
+    """
+    # Pozycja w cyklu (0 to start cyklu)
+    cycle_position = (np.asarray(arrival_ts).astype(np.int64) + light_info['offset']) % light_info['cycle_time']
+    return _build_delay_lut(light_info)[cycle_position], _light_status_codes(light_info, cycle_position)
+
+def _delays_batch(light_lut, cycle_time, offset, ts_array):
+    """Opóźnienia na jednym świetle dla wielu czasów przybycia (sekundy od epoki) - jedno np.mod i odczyt z tablicy"""
+    return light_lut[np.mod(np.asarray(ts_array).astype(np.int64) + offset, cycle_time)]
+
 def estimate_traffic_light_delay(light_info, arrival_time):
     """
     Szacuje opóźnienie na światłach w zależności od czasu przybycia.
@@ -200,114 +522,113 @@ def estimate_traffic_light_delay(light_info, arrival_time):
     """
     # Uwzględnij strefę czasową
     if arrival_time.tzinfo is None:
-        arrival_time = arrival_time.replace(tzinfo=pytz.UTC)
+        arrival_time = arrival_time.replace(tzinfo=timezone.utc)
     
-    # Oblicz czas w bieżącym cyklu
-    seconds_since_epoch = arrival_time.timestamp()
-    cycle_time = light_info['cycle_time']
-    offset = light_info['offset']
+    delay, status_code = _delay_from_ts(light_info, arrival_time.timestamp())
+    return int(delay), LIGHT_STATUSES[status_code]
+
+def _green_window_speed(light_info, start_ts, distance, current_speed, min_speed, max_speed):
+    """
+    Wyznacza wprost prędkość, przy której dojedziemy do świateł na zielonym.
     
-    # Pozycja w cyklu (0 to start cyklu)
-    cycle_position = (int(seconds_since_epoch) + offset) % cycle_time
+    Zielone trwa od pozycji 0 do green_time w cyklu, więc w czasie epoki są to okna
+    [n*cycle_time - offset, n*cycle_time - offset + green_time). Dla każdego okna osiągalnego
+    w przedziale prędkości wybieramy czas przybycia najbliższy obecnemu.
     
-    # Określ fazę świateł
-    green_time = light_info['green_time']
-    yellow_time = light_info['yellow_time']
-    red_time = cycle_time - green_time - yellow_time
-    
-    # Sprawdź w której fazie jesteśmy
-    if cycle_position < green_time:
-        # Zielone światło
-        status = 'green'
-        delay = 0
-    elif cycle_position < green_time + yellow_time:
-        # Żółte światło
-        status = 'yellow'
-        delay = TRAFFIC_LIGHT_DELAYS['yellow']
-    else:
-        # Czerwone światło
-        status = 'red'
-        red_position = cycle_position - green_time - yellow_time
-        red_fraction = red_position / red_time
-        
-        if red_fraction < 0.25:
-            # Początek czerwonego
-            delay = TRAFFIC_LIGHT_DELAYS['red_start']
-        elif red_fraction < 0.75:
-            # Środek czerwonego
-            delay = TRAFFIC_LIGHT_DELAYS['red_middle']
-        else:
-            # Koniec czerwonego
-            delay = TRAFFIC_LIGHT_DELAYS['red_end']
+    Args:
+        light_info: Informacje o sygnalizacji
+        start_ts: Aktualny czas w sekundach od epoki
+        distance: Odległość do świateł w metrach
+        current_speed: Aktualna prędkość w m/s
+        min_speed: Minimalna dopuszczalna prędkość w m/s
+        max_speed: Maksymalna dopuszczalna prędkość w m/s
+    
+    Returns:
+        Prędkość najbliższa aktualnej trafiająca na zielone lub None, gdy takiej nie ma
+    """
+    if distance <= 0 or min_speed > max_speed:
+        return None
     
-    return delay, status
+    cycle_time = light_info['cycle_time']
+    offset = light_info['offset']
+    
+    # Osiągalne czasy przybycia i czas przybycia przy obecnej prędkości
+    earliest = start_ts + distance / max_speed
+    latest = start_ts + distance / min_speed
+    preferred = start_ts + distance / current_speed
+    
+    # Okna zielonego nachodzące na osiągalny przedział (mały margines przed końcem okna)
+    cycles = np.arange(math.floor((earliest + offset) / cycle_time), math.floor((latest + offset) / cycle_time) + 1)
+    window_start = np.maximum(cycles * cycle_time - offset, earliest)
+    window_end = np.minimum(cycles * cycle_time - offset + light_info['green_time'] - 1e-3, latest)
+    feasible = window_start <= window_end
+    if not feasible.any():
+        return None
+    
+    # Najbliższy preferowanemu czas w każdym oknie i odpowiadające mu prędkości
+    arrivals = np.clip(preferred, window_start[feasible], window_end[feasible])
+    speeds = distance / (arrivals - start_ts)
+    return float(speeds[np.argmin(np.abs(speeds - current_speed))])
 
-def optimize_arrival_time(light_info, current_time, current_speed, distance_to_light):
+def _optimize_speed(light_info, start_ts, current_speed, distance_to_light):
     """
-    Optymalizuje czas przybycia do świateł, sugerując dostosowanie prędkości.
+    Wyszukuje prędkość z najmniejszym opóźnieniem na światłach (czasy w sekundach od epoki).
     
     Args:
         light_info: Informacje o sygnalizacji
-        current_time: Aktualny czas (datetime)
-        current_speed: Aktualna prędkość w m/s
+        start_ts: Aktualny czas w sekundach od epoki
+        current_speed: Aktualna prędkość w m/s (większa od zera)
         distance_to_light: Odległość do świateł w metrach
     
     Returns:
-        Słownik z informacjami optymalizacyjnymi (sugerowana prędkość, oszczędność czasu)
+        Opóźnienie i kod fazy przy aktualnej prędkości oraz najlepsza prędkość z jej opóźnieniem i kodem fazy
     """
-    if current_speed <= 0:
-        return {"success": False, "message": "Brak danych o prędkości"}
-    
-    # Oblicz bazowy czas przybycia
-    base_arrival_time = current_time + timedelta(seconds=distance_to_light/current_speed)
-    
     # Sprawdź opóźnienie przy bazowym czasie przybycia
-    base_delay, base_status = estimate_traffic_light_delay(light_info, base_arrival_time)
+    base_delay, base_code = _delay_from_ts(light_info, start_ts + distance_to_light/current_speed)
+    base_delay, base_code = int(base_delay), int(base_code)
     
     # Jeśli już trafiamy na zielone, nie ma potrzeby optymalizacji
-    if base_status == 'green':
+    if LIGHT_STATUSES[base_code] == 'green':
+        return base_delay, base_code, current_speed, base_delay, base_code
+    
+    # Przedział prędkości do rozważenia (80% - 120% aktualnej prędkości)
+    min_speed = max(current_speed * 0.8, 5)  # Minimum 5 m/s (18 km/h)
+    max_speed = min(current_speed * 1.2, 30)  # Maximum 30 m/s (108 km/h)
+    
+    # Prędkość trafiająca na zielone wyznaczona wprost z okien fazy zielonej
+    green_speed = _green_window_speed(light_info, start_ts, distance_to_light, current_speed, min_speed, max_speed)
+    if green_speed is not None:
+        return base_delay, base_code, green_speed, TRAFFIC_LIGHT_DELAYS['green'], LIGHT_STATUSES.index('green')
+    
+    # Brak osiągalnego zielonego - testuj różne prędkości z krokiem 0.5 m/s, szukając najmniejszego opóźnienia
+    test_speeds = np.arange(min_speed, max_speed + 1e-9, 0.5, dtype=np.float64)  # włącznie z max_speed
+    test_delays = _delays_batch(_build_delay_lut(light_info), light_info['cycle_time'], light_info['offset'],
+                                start_ts + distance_to_light / test_speeds)
+    
+    # Kod fazy potrzebny jest tylko dla wybranej prędkości
+    best = int(np.argmin(test_delays)) if len(test_delays) else -1
+    if best >= 0 and test_delays[best] < base_delay:
+        best_speed = float(test_speeds[best])
+        best_delay, best_code = _delay_from_ts(light_info, start_ts + distance_to_light / best_speed)
+        return base_delay, base_code, best_speed, int(best_delay), int(best_code)
+    return base_delay, base_code, current_speed, base_delay, base_code
+
+def _optimization_result(current_time, current_speed, distance_to_light, base_delay, base_code,
+                         best_speed, best_delay, best_code):
+    """Słownik z wynikiem optymalizacji (patrz optimize_arrival_time) dla wyników _optimize_speed"""
+    best_arrival = current_time + timedelta(seconds=distance_to_light/best_speed)
+    
+    if LIGHT_STATUSES[base_code] == 'green':
         return {
             "success": True,
             "optimized": False,
             "message": "Aktualna prędkość jest optymalna, trafisz na zielone światło",
             "suggested_speed": current_speed,
             "time_saved": 0,
-            "current_status": base_status,
-            "arrival_time": base_arrival_time
+            "current_status": LIGHT_STATUSES[base_code],
+            "arrival_time": best_arrival
         }
     
-    # Ustawienia optymalizacji
-    cycle_time = light_info['cycle_time']
-    green_time = light_info['green_time']
-    yellow_time = light_info['yellow_time']
-    offset = light_info['offset']
-    
-    # Przedział prędkości do rozważenia (80% - 120% aktualnej prędkości)
-    min_speed = max(current_speed * 0.8, 5)  # Minimum 5 m/s (18 km/h)
-    max_speed = min(current_speed * 1.2, 30)  # Maximum 30 m/s (108 km/h)
-    
-    # Sprawdź różne prędkości
-    best_speed = current_speed
-    best_delay = base_delay
-    best_status = base_status
-    best_arrival = base_arrival_time
-    
-    # Testuj różne prędkości z krokiem 0.5 m/s
-    for test_speed in [min_speed + 0.5*i for i in range(int((max_speed-min_speed)/0.5)+1)]:
-        test_arrival_time = current_time + timedelta(seconds=distance_to_light/test_speed)
-        test_delay, test_status = estimate_traffic_light_delay(light_info, test_arrival_time)
-        
-        # Jeśli znaleźliśmy lepszą prędkość (mniejsze opóźnienie)
-        if test_delay < best_delay:
-            best_delay = test_delay
-            best_speed = test_speed
-            best_status = test_status
-            best_arrival = test_arrival_time
-        
-        # Jeśli znaleźliśmy zielone światło, możemy zakończyć
-        if test_status == 'green':
-            break
-    
     # Oblicz oszczędność czasu
     time_saved = base_delay - best_delay
     
@@ -336,17 +657,120 @@ def optimize_arrival_time(light_info, current_time, current_speed, distance_to_l
         "suggested_speed_kmh": best_speed_kmh,
         "current_speed_kmh": current_speed_kmh,
         "time_saved": time_saved,
-        "current_status": best_status,
+        "current_status": LIGHT_STATUSES[best_code],
         "arrival_time": best_arrival
     }
 
-def analyze_route_for_lights(route_data, average_speed_ms=11):
+def optimize_arrival_time(light_info, current_time, current_speed, distance_to_light):
+    """
+    Optymalizuje czas przybycia do świateł, sugerując dostosowanie prędkości.
+    
+    Args:
+        light_info: Informacje o sygnalizacji
+        current_time: Aktualny czas (datetime)
+        current_speed: Aktualna prędkość w m/s
+        distance_to_light: Odległość do świateł w metrach
+    
+    Returns:
+        Słownik z informacjami optymalizacyjnymi (sugerowana prędkość, oszczędność czasu)
+    """
+    if current_speed <= 0:
+        return {"success": False, "message": "Brak danych o prędkości"}
+    
+    # Czasy liczymy w sekundach od epoki - datetime odtwarzamy tylko dla wyniku
+    reference_time = current_time if current_time.tzinfo else current_time.replace(tzinfo=timezone.utc)
+    speeds = _optimize_speed(light_info, reference_time.timestamp(), current_speed, distance_to_light)
+    return _optimization_result(current_time, current_speed, distance_to_light, *speeds)
+
+# Rekord analizy jednego światła na trasie (patrz _scan_and_analyze), czasy w sekundach od startu
+_LIGHT_ANALYSIS_DTYPE = np.dtype([
+    ('point_index', np.int64),       # indeks punktu trasy
+    ('light_index', np.int64),       # indeks światła w LightTable
+    ('distance', np.float64),        # odległość od początku trasy w metrach
+    ('leg_distance', np.float64),    # odległość od poprzedniego światła w metrach
+    ('arrival_time', np.float64),    # przybycie przy stałej prędkości
+    ('original_delay', np.int64),
+    ('status', np.int8),             # kody faz to indeksy w LIGHT_STATUSES
+    ('departure_time', np.float64),  # początek optymalizacji - odjazd spod poprzedniego światła
+    ('base_delay', np.int64),
+    ('base_status', np.int8),
+    ('suggested_speed', np.float64),
+    ('best_delay', np.int64),
+    ('best_status', np.int8),
+    ('optimized', np.bool_),
+    ('optimized_delay', np.int64),
+])
+
+def _scan_and_analyze(points, lights, route_cumdist, speed, start_ts):
+    """
+    Wykrywa światła na trasie i od razu wyznacza dla nich opóźnienia oraz optymalną
+    prędkość - jeden przebieg bez słowników dla wyników pośrednich.
+    
+    Args:
+        points: Punkty geometrii trasy [lon, lat] (tablica NumPy float64)
+        lights: LightTable do przeszukania
+        route_cumdist: Odległość wzdłuż trasy w metrach dla każdego punktu (patrz _route_cumdist)
+        speed: Średnia prędkość w m/s
+        start_ts: Czas startu w sekundach od epoki
+    
+    Returns:
+        Tablica rekordów _LIGHT_ANALYSIS_DTYPE w kolejności wzdłuż trasy
+    """
+    point_idx, light_idx = _detect_cached(points.tobytes(), LIGHT_DETECTION_RADIUS_METERS, lights, METERS_PER_DEG_LON)
+    records = np.zeros(len(light_idx), dtype=_LIGHT_ANALYSIS_DTYPE)
+    if len(light_idx) == 0:
+        return records
+    
+    # Czasy przybycia przy stałej prędkości i odcinki między kolejnymi światłami (pierwszy od początku trasy)
+    records['point_index'] = point_idx
+    records['light_index'] = light_idx
+    records['distance'] = route_cumdist[point_idx]
+    records['leg_distance'] = np.diff(records['distance'], prepend=0.0)
+    records['arrival_time'] = records['distance'] / speed
+    
+    # Opóźnienia bez optymalizacji nie zależą od pozostałych świateł - jeden przebieg skompilowanej pętli
+    records['original_delay'], records['status'] = _light_phases(
+        start_ts + records['arrival_time'], light_idx,
+        lights.cycle_time, lights.offset, lights.green_time, lights.yellow_time,
+        lights.delay_lut, lights.lut_offset
+    )
+    
+    # Optymalizacja zależy od czasu odjazdu spod poprzedniego światła
+    arrival_times = records['arrival_time'].tolist()
+    original_delays = records['original_delay'].tolist()
+    leg_distances = records['leg_distance'].tolist()
+    departure = 0.0
+    departures, optimizations = [], []
+    for k, j in enumerate(light_idx.tolist()):
+        optimization = _optimize_speed(lights.light_info(j), start_ts + departure, speed, leg_distances[k])
+        departures.append(departure)
+        optimizations.append(optimization)
+        
+        # Zaktualizuj czas dla następnych świateł
+        best_speed = optimization[2]
+        if best_speed != speed:
+            departure += leg_distances[k] / best_speed
+        else:
+            departure = arrival_times[k] + original_delays[k]
+    
+    records['departure_time'] = departures
+    for name, column in zip(('base_delay', 'base_status', 'suggested_speed', 'best_delay', 'best_status'),
+                            zip(*optimizations)):
+        records[name] = column
+    
+    # Zakładamy, że optymalizacja pozwala uniknąć opóźnienia
+    records['optimized'] = records['suggested_speed'] != speed
+    records['optimized_delay'] = np.where(records['optimized'], 0, records['original_delay'])
+    return records
+
+def analyze_route_for_lights(route_data, average_speed_ms=11, candidate_lights=None):
     """
     Analizuje całą trasę pod kątem sygnalizacji świetlnej i tworzy optymalny plan.
     
     Args:
         route_data: Dane trasy z geometrią, segmentami, etc.
         average_speed_ms: Średnia prędkość w m/s (domyślnie ~40 km/h)
+        candidate_lights: Opcjonalny podzbiór świateł do sprawdzenia (patrz detect_traffic_lights_on_route)
     
     Returns:
         Słownik z analizą i zaleceniami dla sygnalizacji na trasie
@@ -363,19 +787,37 @@ def analyze_route_for_lights(route_data, average_speed_ms=11):
     if not route_data or 'segments' not in route_data:
         return {"success": False, "message": "Brak danych trasy"}
     
-    # Złącz geometrię ze wszystkich segmentów
-    all_geometry = []
-    for segment in route_data['segments']:
-        if 'geometry' in segment:
-            all_geometry.extend(segment['geometry'])
+    # Złącz geometrię ze wszystkich segmentów w jedną tablicę o znanym z góry rozmiarze
+    geometries = [segment['geometry'] for segment in route_data['segments'] if segment.get('geometry')]
+    all_geometry = np.empty((sum(map(len, geometries)), 2), dtype=np.float64)
+    position = 0
+    for geometry in geometries:
+        all_geometry[position:position + len(geometry)] = np.asarray(geometry, dtype=np.float64)[:, :2]
+        position += len(geometry)
     
     # Jeśli używamy zakodowanej geometrii, zdekoduj ją
     # Ta część wymagałaby biblioteki do dekodowania polyline
     
-    # Wykryj światła na trasie
-    lights = detect_traffic_lights_on_route(all_geometry)
+    # Odległość wzdłuż trasy liczona raz i zapamiętana w danych trasy
+    route_cumdist = route_data.get('_cumdist_m')
+    if route_cumdist is None:
+        route_cumdist = np.zeros(0, dtype=np.float32)
+        if len(all_geometry):
+            route_cumdist = _route_cumdist(all_geometry)
+        route_data['_cumdist_m'] = route_cumdist
+    
+    # Tablica świateł do przeszukania
+    light_table = _lights_for_route(all_geometry, candidate_lights)
     
-    if not lights:
+    # Początkowy czas
+    start_time = datetime.now(timezone.utc)
+    
+    # Wykrycie świateł, opóźnienia i optymalizacja w jednym przebiegu - rekordy w kolejności wzdłuż trasy
+    records = np.zeros(0, dtype=_LIGHT_ANALYSIS_DTYPE)
+    if light_table and len(all_geometry):
+        records = _scan_and_analyze(all_geometry, light_table, route_cumdist, average_speed_ms, start_time.timestamp())
+    
+    if len(records) == 0:
         return {
             "success": True,
             "message": "Nie wykryto sygnalizacji świetlnej na trasie",
@@ -383,55 +825,36 @@ def analyze_route_for_lights(route_data, average_speed_ms=11):
         }
     
     # Oblicz całkowitą długość trasy w metrach
-    total_distance = 0
-    for i in range(len(all_geometry) - 1):
-        p1 = all_geometry[i]
-        p2 = all_geometry[i + 1]
-        # Przybliżenie odległości
-        segment_dist = math.sqrt((p2[0] - p1[0])**2 + (p2[1] - p1[1])**2) * 111000  # 1 stopień ≈ 111 km
-        total_distance += segment_dist
-    
-    # Początkowy czas
-    start_time = datetime.now(pytz.UTC)
-    current_time = start_time
-    
-    # Analizuj każde światło na trasie
-    for i, light in enumerate(lights):
-        # Oblicz dystans od początku trasy
-        light_distance = light['distance_along_route'] * 111000  # Konwersja na metry
-        
-        # Oszacuj czas przybycia do światła
-        time_to_light = light_distance / average_speed_ms
-        arrival_time = start_time + timedelta(seconds=time_to_light)
-        
-        # Sprawdź opóźnienie bez optymalizacji
-        original_delay, status = estimate_traffic_light_delay(light, arrival_time)
-        
-        # Optymalizuj prędkość
-        optimization = optimize_arrival_time(
-            light, current_time, average_speed_ms, 
-            light_distance - (i > 0 and lights[i-1]['distance_along_route'] * 111000 or 0)
+    total_distance = float(route_cumdist[-1])
+    
+    # Słowniki z wynikami budujemy raz, z kolumn tablicy rekordów
+    columns = {name: records[name].tolist() for name in _LIGHT_ANALYSIS_DTYPE.names}
+    light_idx = records['light_index']
+    coordinates = np.column_stack((light_table.lon[light_idx], light_table.lat[light_idx])).tolist()
+    cycle_times = light_table.cycle_time[light_idx].tolist()
+    types = [LIGHT_TYPES[code] for code in light_table.type_code[light_idx].tolist()]
+    
+    for i in range(len(records)):
+        arrival_time = start_time + timedelta(seconds=columns['arrival_time'][i])
+        optimization = _optimization_result(
+            start_time + timedelta(seconds=columns['departure_time'][i]), average_speed_ms, columns['leg_distance'][i],
+            columns['base_delay'][i], columns['base_status'][i],
+            columns['suggested_speed'][i], columns['best_delay'][i], columns['best_status'][i]
         )
-        
-        # Zaktualizuj czas dla następnych świateł
-        if optimization['optimized']:
-            current_time = optimization['arrival_time']
-            optimized_delay = 0  # Zakładamy, że optymalizacja pozwala uniknąć opóźnienia
-        else:
-            current_time = arrival_time + timedelta(seconds=original_delay)
-            optimized_delay = original_delay
+        original_delay = columns['original_delay'][i]
+        optimized_delay = columns['optimized_delay'][i]
         
         # Dodaj dane światła do wyników
         light_result = {
             "position": i + 1,
-            "distance": light_distance,
-            "coordinates": light['coordinates'],
-            "cycle_time": light['cycle_time'],
-            "type": light['type'],
+            "distance": columns['distance'][i],
+            "coordinates": coordinates[i],
+            "cycle_time": cycle_times[i],
+            "type": types[i],
             "estimated_arrival": arrival_time.strftime("%H:%M:%S"),
             "original_delay": original_delay,
             "optimized_delay": optimized_delay,
-            "light_status": status,
+            "light_status": LIGHT_STATUSES[columns['status'][i]],
             "optimization": optimization
         }
         
@@ -481,7 +904,7 @@ def get_light_timing_for_route(route_geometry):
         for light in lights:
             simplified_lights.append({
                 'coordinates': light['coordinates'],
-                'distance': light['distance_along_route'] * 111000,  # Konwersja na metry
+                'distance': light['distance_along_route'],  # W metrach
                 'cycle_time': light['cycle_time'],
                 'green_time': light['green_time'],
                 'type': light['type']
@@ -512,7 +935,7 @@ if __name__ == "__main__":
         test_light = lights[0]
         optimization = optimize_arrival_time(
             test_light,
-            datetime.now(pytz.UTC),
+            datetime.now(timezone.utc),
             11.0,  # ~40 km/h
             500.0  # 500 metrów do światła
         )